@@ -0,0 +1,461 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import itertools
+import statistics
+import subprocess
+
+from datetime import datetime, timezone
+
+from __protocol__ import (
+    FRAME_CHAT,
+    FRAME_RESPONSE,
+    STATUS_OK,
+    Frame,
+    FrameReader,
+    ProtocolError,
+    decode_response,
+    encode_frame,
+    encode_request
+)
+from __server__ import RateLimits, Server
+from __loop__ import LOOP_BACKENDS, available_loop_backends, resolve_loop_backend, run as run_event_loop
+
+class BenchClient(object):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.frames = FrameReader(reader)
+        self.correlation_ids = itertools.count(1)
+        self.received = 0
+        self.progress = asyncio.Event()
+
+
+    @classmethod
+    async def connect(cls, hostname: str, port: int, username: str) -> "BenchClient":
+        reader, writer = await asyncio.open_connection(hostname, port)
+        client = cls(reader=reader, writer=writer)
+
+        status, body = await client.request("/username", username)
+        if status != STATUS_OK:
+            raise ProtocolError(f"username {username} was rejected with status {status}")
+
+        return client
+
+
+    async def request(self, command: str, argument: str = "") -> tuple[int, str]:
+        correlation_id: int = next(self.correlation_ids)
+        self.writer.write(encode_request(correlation_id, command, argument))
+        await self.writer.drain()
+
+        while True:
+            frame: Frame | None = await self.frames.read()
+            if frame is None:
+                raise ConnectionResetError("server closed the connection")
+
+            if frame.type != FRAME_RESPONSE:
+                continue
+
+            response_id, status, body = decode_response(frame.payload)
+            if response_id == correlation_id:
+                return status, body.decode()
+
+
+    def send_chat(self, message: bytes) -> None:
+        self.writer.write(encode_frame(FRAME_CHAT, message))
+
+
+    async def count_chat(self, marker: bytes, expected: int) -> None:
+        while self.received < expected:
+            frame: Frame | None = await self.frames.read()
+            if frame is None:
+                raise ConnectionResetError("server closed the connection")
+
+            if frame.type == FRAME_CHAT and marker in frame.payload:
+                self.received += 1
+                self.progress.set()
+
+
+    async def collect_latencies(self, marker: bytes, samples: list[float]) -> None:
+        while True:
+            frame: Frame | None = await self.frames.read()
+            if frame is None:
+                return
+
+            if frame.type != FRAME_CHAT:
+                continue
+
+            _, found, sent_at = frame.payload.rpartition(marker)
+            if found:
+                samples.append((time.perf_counter_ns() - int(sent_at)) / 1e9)
+                self.received += 1
+
+
+    async def wait_for_received(self, minimum: int) -> None:
+        while self.received < minimum:
+            self.progress.clear()
+            await self.progress.wait()
+
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(name: str, samples: list[float]) -> dict:
+    if not samples:
+        print(f"\n📊 {name} (no samples)")
+        return {"samples": 0}
+
+    summary = {
+        "samples": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "p999_ms": percentile(samples, 0.999) * 1000,
+        "max_ms": max(samples) * 1000
+    }
+
+    print(f"\n📊 {name} ({len(samples)} samples)")
+    print(f"\tmean {summary['mean_ms']:.3f} ms")
+    print(f"\tp50  {summary['p50_ms']:.3f} ms")
+    print(f"\tp99  {summary['p99_ms']:.3f} ms")
+    print(f"\tp999 {summary['p999_ms']:.3f} ms")
+    print(f"\tmax  {summary['max_ms']:.3f} ms")
+    return summary
+
+def read_rss(pid: int) -> int:
+    pids: list[int] = [pid]
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as children:
+                pids.extend(int(child) for child in children.read().split())
+
+    except OSError:
+        pass
+
+    total = 0
+    for process_id in pids:
+        try:
+            with open(f"/proc/{process_id}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+
+        except OSError:
+            continue
+
+    return total
+
+async def bench_join_latency(hostname: str, port: int, joins: int) -> list[float]:
+    owner = await BenchClient.connect(hostname, port, "bench-owner")
+    _, room_id = await owner.request("/create", "join latency benchmark")
+
+    samples: list[float] = []
+    for index in range(joins):
+        client = await BenchClient.connect(hostname, port, f"bench-{index}")
+
+        started = time.perf_counter()
+        status, _ = await client.request("/connect", room_id)
+        samples.append(time.perf_counter() - started)
+
+        if status != STATUS_OK:
+            raise ProtocolError(f"join was rejected with status {status}")
+
+        await client.close()
+
+    await owner.close()
+    return samples
+
+async def bench_throughput(hostname: str, port: int, rooms: int, members: int, messages: int, window: int = 16) -> dict:
+    marker: bytes = b"bench-payload"
+    clients: list[BenchClient] = []
+    for room_index in range(rooms):
+        owner = await BenchClient.connect(hostname, port, f"owner-{room_index}")
+        _, room_id = await owner.request("/create", f"throughput benchmark {room_index}")
+        await owner.close()
+
+        for member_index in range(members):
+            client = await BenchClient.connect(hostname, port, f"member-{room_index}-{member_index}")
+            status, _ = await client.request("/connect", room_id)
+            if status != STATUS_OK:
+                raise ProtocolError(f"join was rejected with status {status}")
+
+            clients.append(client)
+
+    expected: int = members * messages
+    receivers = [asyncio.create_task(client.count_chat(marker, expected)) for client in clients]
+
+    started = time.perf_counter()
+    for round_index in range(messages):
+        if round_index >= window:
+            minimum: int = (round_index - window) * members
+            for client in clients:
+                await client.wait_for_received(minimum)
+
+        for client in clients:
+            client.send_chat(marker)
+
+    await asyncio.gather(*receivers)
+    elapsed = time.perf_counter() - started
+
+    for client in clients:
+        await client.close()
+
+    delivered: int = len(clients) * expected
+    print(f"\n📊 Throughput ({rooms} rooms x {members} members, {messages} messages each)")
+    print(f"\tdelivered {delivered} messages in {elapsed:.3f} s")
+    print(f"\t{delivered / elapsed:.0f} messages/s")
+    return {"messages_delivered": delivered, "elapsed_seconds": elapsed, "messages_per_second": delivered / elapsed}
+
+async def bench_bots(
+    hostname: str,
+    port: int,
+    bots: int,
+    rooms: int,
+    rate: float,
+    duration: float,
+    connect_concurrency: int = 100
+) -> dict:
+    marker: bytes = b"bench-sent-at:"
+
+    owner = await BenchClient.connect(hostname, port, "bots-owner")
+    room_ids: list[str] = []
+    for room_index in range(rooms):
+        _, room_id = await owner.request("/create", f"bots benchmark {room_index}")
+        room_ids.append(room_id)
+
+    await owner.close()
+
+    clients: list[BenchClient] = []
+    semaphore = asyncio.Semaphore(connect_concurrency)
+
+    async def connect_bot(index: int) -> BenchClient:
+        async with semaphore:
+            client = await BenchClient.connect(hostname, port, f"bot-{index}")
+            status, _ = await client.request("/connect", room_ids[index % rooms])
+            if status != STATUS_OK:
+                raise ProtocolError(f"join was rejected with status {status}")
+
+            return client
+
+    started = time.perf_counter()
+    clients = await asyncio.gather(*(connect_bot(index) for index in range(bots)))
+    connect_elapsed = time.perf_counter() - started
+
+    samples: list[float] = []
+    receivers = [asyncio.create_task(client.collect_latencies(marker, samples)) for client in clients]
+
+    async def chat(client: BenchClient) -> int:
+        interval: float = 1 / rate
+        deadline: float = time.perf_counter() + duration
+        await asyncio.sleep(random.uniform(0, interval))
+
+        sent = 0
+        while time.perf_counter() < deadline:
+            client.send_chat(marker + str(time.perf_counter_ns()).encode())
+            sent += 1
+            await asyncio.sleep(interval)
+
+        return sent
+
+    started = time.perf_counter()
+    sent: int = sum(await asyncio.gather(*(chat(client) for client in clients)))
+    await asyncio.sleep(min(duration, 1.0))
+    elapsed = time.perf_counter() - started
+
+    for receiver in receivers:
+        receiver.cancel()
+
+    await asyncio.gather(*receivers, return_exceptions=True)
+    for client in clients:
+        await client.close()
+
+    delivered: int = sum(client.received for client in clients)
+    results = {
+        "connections": bots,
+        "connections_per_second": bots / connect_elapsed,
+        "messages_sent": sent,
+        "messages_delivered": delivered,
+        "messages_per_second": delivered / elapsed,
+        "delivery_latency": summarize("End-to-end delivery latency", samples)
+    }
+
+    print(f"\n📊 Bots ({bots} bots in {rooms} rooms, {rate} messages/s each for {duration} s)")
+    print(f"\t{results['connections_per_second']:.0f} connections/s")
+    print(f"\tsent {sent}, delivered {delivered} messages ({results['messages_per_second']:.0f} messages/s)")
+    return results
+
+def reserve_port(hostname: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind((hostname, 0))
+        return probe.getsockname()[1]
+
+async def wait_for_port(hostname: str, port: int, attempts: int = 100) -> None:
+    for _ in range(attempts):
+        try:
+            _, writer = await asyncio.open_connection(hostname, port)
+            writer.close()
+            await writer.wait_closed()
+            return
+
+        except ConnectionRefusedError:
+            await asyncio.sleep(0.05)
+
+    raise ConnectionRefusedError(f"server on {hostname}:{port} did not come up")
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmarks for the chat server")
+    parser.add_argument("--scenario", choices=("join", "throughput", "bots"), default="join")
+    parser.add_argument("--host", default=None, help="benchmark a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--server-pid", type=int, default=None, help="pid of the running server, to report its RSS")
+    parser.add_argument("--workers", type=int, default=1, help="start the server as a subprocess with this many workers")
+    parser.add_argument("--joins", type=int, default=200)
+    parser.add_argument("--rooms", type=int, default=8)
+    parser.add_argument("--members", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--bots", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second sent by each bot")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each bot keeps chatting")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--loop", default="auto", choices=(*LOOP_BACKENDS, "compare"), help="event loop backend, compare runs the scenario once per installed backend")
+    parser.add_argument("--json", default=None, help="write the results as JSON to this path, or - for stdout")
+    return parser.parse_args()
+
+async def run_scenario(args: argparse.Namespace, loop_backend: str) -> dict:
+    hostname: str = args.host or "127.0.0.1"
+    port: int = args.port
+    server_pid: int | None = args.server_pid
+
+    server_task = None
+    server_process = None
+    if args.host is None and args.workers > 1:
+        port = reserve_port(hostname)
+        server_process = subprocess.Popen(
+            [
+                sys.executable, "__server__.py", "--host", hostname, "--port", str(port),
+                "--workers", str(args.workers), "--loop", loop_backend, "--no-rate-limits"
+            ],
+            stdout=subprocess.DEVNULL
+        )
+        server_pid = server_process.pid
+        await wait_for_port(hostname, port)
+
+    elif args.host is None:
+        server = Server(hostname=hostname, port=0, rate_limits=RateLimits.unlimited())
+        server_task = asyncio.create_task(server.run())
+        while server.server is None:
+            await asyncio.sleep(0)
+
+        port = server.server.sockets[0].getsockname()[1]
+        server_pid = os.getpid()
+
+    print(f"\n⚙️  Running the {args.scenario} scenario on the {loop_backend} event loop")
+    try:
+        if args.scenario == "join":
+            samples = await bench_join_latency(hostname=hostname, port=port, joins=args.joins)
+            results = {"join_latency": summarize("/connect round-trip", samples)}
+
+        elif args.scenario == "throughput":
+            results = await bench_throughput(
+                hostname=hostname,
+                port=port,
+                rooms=args.rooms,
+                members=args.members,
+                messages=args.messages
+            )
+
+        else:
+            results = await bench_bots(
+                hostname=hostname,
+                port=port,
+                bots=args.bots,
+                rooms=args.rooms,
+                rate=args.rate,
+                duration=args.duration,
+                connect_concurrency=args.connect_concurrency
+            )
+
+        if server_pid is not None:
+            results["server_rss_bytes"] = read_rss(server_pid)
+            results["server_in_process"] = server_task is not None
+            print(f"\tserver RSS {results['server_rss_bytes'] / (1 << 20):.1f} MiB")
+
+    finally:
+        if server_task is not None:
+            server_task.cancel()
+            await asyncio.gather(server_task, return_exceptions=True)
+
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
+
+    return results
+
+def print_comparison(results_by_loop: dict[str, dict]) -> None:
+    metrics: list[str] = []
+    for results in results_by_loop.values():
+        for name, value in results.items():
+            if isinstance(value, dict):
+                metrics.extend(f"{name}.{key}" for key, nested in value.items() if isinstance(nested, (int, float)) and f"{name}.{key}" not in metrics)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool) and name not in metrics:
+                metrics.append(name)
+
+    backends: list[str] = list(results_by_loop)
+    print(f"\n📊 Event loop comparison")
+    print("\t" + f"{'metric':<36}" + "".join(f"{backend:>16}" for backend in backends))
+    for metric in metrics:
+        name, _, key = metric.partition(".")
+        values: list[str] = []
+        for backend in backends:
+            value = results_by_loop[backend].get(name)
+            if key:
+                value = value.get(key) if isinstance(value, dict) else None
+
+            values.append(f"{value:>16.4g}" if value is not None else f"{'-':>16}")
+
+        print("\t" + f"{metric:<36}" + "".join(values))
+
+def main():
+    args = parse_arguments()
+
+    if args.loop == "compare":
+        loop_backends: list[str] = available_loop_backends()
+    else:
+        loop_backends = [resolve_loop_backend(args.loop)[1]]
+
+    results_by_loop: dict[str, dict] = {}
+    for loop_backend in loop_backends:
+        results_by_loop[loop_backend] = run_event_loop(run_scenario(args=args, loop_backend=loop_backend), backend=loop_backend)
+
+    if len(results_by_loop) > 1:
+        print_comparison(results_by_loop)
+
+    if args.json is not None:
+        report = {
+            "scenario": args.scenario,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "parameters": vars(args),
+            "loops": loop_backends,
+            "results": results_by_loop if len(results_by_loop) > 1 else results_by_loop[loop_backends[0]]
+        }
+        if args.json == "-":
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, "w") as report_file:
+                json.dump(report, report_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import signal
+import asyncio
+import argparse
+import itertools
+
+from collections import deque
+
+from __protocol__ import (
+    FRAME_BUS_EVENT,
+    CLAIM_HEADER,
+    CLAIM_RESULT_HEADER,
+    BUS_WELCOME,
+    BUS_NODE_LEFT,
+    BUS_CREATE_ROOM,
+    BUS_SET_STATUS,
+    BUS_REMOVE_ROOM,
+    BUS_JOIN,
+    BUS_LEAVE,
+    BUS_BROADCAST,
+    BUS_CLAIM_USERNAME,
+    BUS_CLAIM_RESULT,
+    BUS_RELEASE_USERNAME,
+    Frame,
+    FrameReader,
+    ProtocolError,
+    decode_bus_event,
+    encode_bus_event,
+    encode_frame
+)
+from __logging__ import logger, setup_logging
+from __loop__ import LOOP_BACKENDS, run as run_event_loop
+
+MAX_LINK_BACKLOG: int = 64 << 20
+
+class BrokerRoom(object):
+    __slots__ = ("title", "status", "members")
+
+    def __init__(self, title: bytes) -> None:
+        self.title = title
+        self.status = b"opened"
+        self.members: dict[bytes, int] = {}
+
+class BrokerPeer(object):
+    __slots__ = ("writer", "node_id", "queue", "queued_bytes", "ready", "task")
+
+    def __init__(self, writer: asyncio.StreamWriter, node_id: int) -> None:
+        self.writer = writer
+        self.node_id = node_id
+        self.queue: deque[bytes] = deque()
+        self.queued_bytes = 0
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self.__flush_forever())
+
+
+    def send(self, encoded_events: bytes) -> None:
+        if self.writer.is_closing():
+            return
+
+        # Bus events cannot be dropped, a node that falls this far behind is cut off and has to reconnect.
+        if self.queued_bytes + len(encoded_events) > MAX_LINK_BACKLOG:
+            logger.warning("disconnecting a lagging node", extra={"node_id": self.node_id, "backlog_bytes": self.queued_bytes})
+            self.close()
+            return
+
+        self.queue.append(encoded_events)
+        self.queued_bytes += len(encoded_events)
+        self.ready.set()
+
+
+    def close(self) -> None:
+        self.task.cancel()
+        self.writer.transport.abort()
+
+
+    async def __flush_forever(self) -> None:
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+
+                batch, self.queue = self.queue, deque()
+                self.queued_bytes = 0
+                self.writer.writelines(batch)
+                await self.writer.drain()
+
+        except ConnectionError:
+            self.queue.clear()
+
+class Broker(object):
+    def __init__(self) -> None:
+        self.server = None
+        self.node_ids = itertools.count(1)
+        self.links: dict[asyncio.StreamWriter, BrokerPeer] = {}
+
+        self.rooms: dict[str, BrokerRoom] = {}
+        self.usernames: dict[bytes, int] = {}
+
+
+    def __relay(self, encoded_events: bytes) -> None:
+        for peer in self.links.values():
+            peer.send(encoded_events)
+
+
+    def __snapshot(self, node_id: int) -> bytes:
+        events: list[bytes] = []
+        for room_id, room in self.rooms.items():
+            events.append(encode_bus_event(BUS_CREATE_ROOM, 0, room_id, room.title))
+            events.append(encode_bus_event(BUS_SET_STATUS, 0, room_id, room.status))
+            for username, origin in room.members.items():
+                events.append(encode_bus_event(BUS_JOIN, origin, room_id, username))
+
+        events.append(encode_bus_event(BUS_WELCOME, node_id))
+        return b"".join(events)
+
+
+    def __apply(self, kind: int, origin: int, room_id: str, body: bytes) -> None:
+        room = self.rooms.get(room_id)
+
+        if kind == BUS_CREATE_ROOM and room is None:
+            self.rooms[room_id] = BrokerRoom(title=body)
+
+        elif kind == BUS_SET_STATUS and room is not None:
+            room.status = body
+
+        elif kind == BUS_REMOVE_ROOM and room is not None:
+            del self.rooms[room_id]
+
+        elif kind == BUS_JOIN and room is not None:
+            room.members[body] = origin
+
+        elif kind == BUS_LEAVE and room is not None:
+            room.members.pop(body, None)
+
+        return
+
+
+    def __claim_username(self, peer: BrokerPeer, node_id: int, body: bytes) -> None:
+        (claim_id,) = CLAIM_HEADER.unpack_from(body)
+        username: bytes = body[CLAIM_HEADER.size:]
+
+        owner: int | None = self.usernames.get(username)
+        granted: bool = owner is None or owner == node_id
+        if granted:
+            self.usernames[username] = node_id
+
+        peer.send(encode_bus_event(BUS_CLAIM_RESULT, 0, "", CLAIM_RESULT_HEADER.pack(claim_id, granted)))
+
+
+    def __forget_node(self, node_id: int) -> None:
+        for username, owner in list(self.usernames.items()):
+            if owner == node_id:
+                del self.usernames[username]
+
+        events: list[bytes] = []
+        for room_id, room in list(self.rooms.items()):
+            for username, origin in list(room.members.items()):
+                if origin == node_id:
+                    del room.members[username]
+
+            # A closing room whose last members were on this node would otherwise outlive every node that could remove it.
+            if room.status == b"removing" and not room.members:
+                del self.rooms[room_id]
+                events.append(encode_bus_event(BUS_REMOVE_ROOM, 0, room_id))
+
+        events.append(encode_bus_event(BUS_NODE_LEFT, node_id))
+        self.__relay(b"".join(events))
+
+
+    async def __link_callback(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        node_id: int = next(self.node_ids)
+        frames = FrameReader(reader)
+
+        peer = BrokerPeer(writer=writer, node_id=node_id)
+        peer.send(self.__snapshot(node_id=node_id))
+        self.links[writer] = peer
+
+        try:
+            while True:
+                frame: Frame | None = await frames.read()
+                if frame is None:
+                    break
+
+                batch: list[bytes] = []
+                while frame is not None:
+                    if frame.type == FRAME_BUS_EVENT:
+                        kind, origin, room_id, body = decode_bus_event(frame.payload)
+
+                        if kind == BUS_CLAIM_USERNAME:
+                            self.__claim_username(peer=peer, node_id=node_id, body=body)
+
+                        elif kind == BUS_RELEASE_USERNAME:
+                            if self.usernames.get(body) == node_id:
+                                del self.usernames[body]
+
+                        else:
+                            self.__apply(kind=kind, origin=origin, room_id=room_id, body=body)
+                            batch.append(encode_frame(FRAME_BUS_EVENT, frame.payload))
+
+                    frame = await frames.read() if frames.pending() else None
+
+                if batch:
+                    self.__relay(b"".join(batch))
+
+        except (ConnectionError, ProtocolError) as e:
+            logger.warning("broker link failed", extra={"node_id": node_id, "error": str(e)})
+
+        finally:
+            del self.links[writer]
+            self.__forget_node(node_id=node_id)
+
+            peer.close()
+
+
+    async def start(self, host: str | None = None, port: int | None = None, path: str | None = None) -> None:
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.__link_callback, path=path)
+        else:
+            self.server = await asyncio.start_server(self.__link_callback, host=host, port=port)
+
+
+    async def run(self, host: str | None = None, port: int | None = None, path: str | None = None) -> None:
+        await self.start(host=host, port=port, path=path)
+
+        async with self.server:
+            await self.server.serve_forever()
+
+class BrokerLink(object):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.node_id = 0
+        self.reader = reader
+        self.writer = writer
+        self.frames = FrameReader(reader)
+
+        self.backlog: list[tuple[int, int, str, bytes]] = []
+        self.claim_ids = itertools.count(1)
+        self.claims: dict[int, asyncio.Future] = {}
+        self.in_flight_broadcasts = 0
+
+
+    @staticmethod
+    async def open(address: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if "/" in address:
+            return await asyncio.open_unix_connection(path=address)
+
+        host, _, port = address.rpartition(":")
+        return await asyncio.open_connection(host or "127.0.0.1", int(port))
+
+
+    @classmethod
+    async def connect(cls, address: str, attempts: int = 100) -> "BrokerLink":
+        for _ in range(attempts):
+            try:
+                reader, writer = await cls.open(address=address)
+                break
+
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.05)
+
+        else:
+            raise ConnectionRefusedError(f"broker at {address} is not reachable")
+
+        link = cls(reader=reader, writer=writer)
+        while True:
+            frame: Frame | None = await link.frames.read()
+            if frame is None:
+                raise ConnectionResetError("broker closed the link during the handshake")
+
+            if frame.type != FRAME_BUS_EVENT:
+                continue
+
+            event = decode_bus_event(frame.payload)
+            if event[0] == BUS_WELCOME:
+                link.node_id = event[1]
+                return link
+
+            link.backlog.append(event)
+
+
+    def publish(self, kind: int, room_id: str = "", body: bytes = b"") -> None:
+        if kind == BUS_BROADCAST:
+            self.in_flight_broadcasts += 1
+
+        self.writer.write(encode_bus_event(kind, self.node_id, room_id, body))
+
+
+    async def claim_username(self, username: str) -> bool:
+        claim_id: int = next(self.claim_ids)
+        claim = asyncio.get_running_loop().create_future()
+        self.claims[claim_id] = claim
+
+        self.publish(BUS_CLAIM_USERNAME, "", CLAIM_HEADER.pack(claim_id) + username.encode())
+        try:
+            return await claim
+
+        finally:
+            self.claims.pop(claim_id, None)
+
+
+    def release_username(self, username: str) -> None:
+        if not self.writer.is_closing():
+            self.publish(BUS_RELEASE_USERNAME, "", username.encode())
+
+
+    async def run(self, on_event) -> None:
+        for event in self.backlog:
+            on_event(*event)
+
+        self.backlog.clear()
+
+        while True:
+            frame: Frame | None = await self.frames.read()
+            if frame is None:
+                break
+
+            if frame.type != FRAME_BUS_EVENT:
+                continue
+
+            kind, origin, room_id, body = decode_bus_event(frame.payload)
+            if kind == BUS_CLAIM_RESULT:
+                claim_id, granted = CLAIM_RESULT_HEADER.unpack_from(body)
+                claim = self.claims.get(claim_id)
+                if claim is not None and not claim.done():
+                    claim.set_result(bool(granted))
+
+                continue
+
+            if kind == BUS_BROADCAST and origin == self.node_id:
+                self.in_flight_broadcasts -= 1
+
+            on_event(kind, origin, room_id, body)
+
+        for claim in self.claims.values():
+            if not claim.done():
+                claim.set_exception(ConnectionResetError("broker closed the link"))
+
+        raise ConnectionResetError("broker closed the link")
+
+def parse_arguments() -> argparse.Namespace:
+    BROKER_HOSTNAME: str = "127.0.0.1"
+    BROKER_PORT: int = 9100
+
+    parser = argparse.ArgumentParser(description="Chat CLI room and presence broker")
+    parser.add_argument("--host", default=BROKER_HOSTNAME)
+    parser.add_argument("--port", type=int, default=BROKER_PORT)
+    parser.add_argument("--unix", default=None, help="listen on a Unix socket path instead of TCP")
+    parser.add_argument("--loop", default="auto", choices=LOOP_BACKENDS, help="event loop backend, auto prefers uvloop when it is installed")
+    parser.add_argument("--log-level", default="info", choices=("debug", "info", "warning", "error"))
+    parser.add_argument("--log-file", default=None, help="write JSON-lines logs to this file with size-based rotation")
+    return parser.parse_args()
+
+async def main(arguments: argparse.Namespace):
+    log_listener = setup_logging(level=arguments.log_level, path=arguments.log_file)
+    broker = Broker()
+    await broker.start(host=arguments.host, port=arguments.port, path=arguments.unix)
+    print(f"\n🚌 Chat CLI broker is listening on {arguments.unix or f'{arguments.host}:{arguments.port}'}\n")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    async with broker.server:
+        await stopping.wait()
+
+    print("\n✅ Broker has been shut down.")
+    log_listener.stop()
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    run_event_loop(main(arguments=arguments), backend=arguments.loop)
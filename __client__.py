@@ -1,34 +1,286 @@
+import os
 import sys
+import stat
+import time
 import signal
 import asyncio
+import argparse
+import itertools
 
-from aioconsole import ainput
+from collections import deque
+
+from __loop__ import LOOP_BACKENDS, new_event_loop
+from __protocol__ import (
+    FRAME_CONTROL,
+    FRAME_TEXT,
+    FRAME_CHAT,
+    FRAME_RESPONSE,
+    FRAME_ERROR,
+    STATUS_OK,
+    STATUS_DUPLICATED_USERNAME,
+    STATUS_NO_AVAILABLE_ROOM,
+    STATUS_ROOM_REMOVING,
+    STATUS_RATE_LIMITED,
+    ASK_USERNAME_PROMPT,
+    EXIT_ROOM,
+    EXIT_CLI,
+    PING,
+    PONG,
+    COMPRESSION_ZLIB,
+    Frame,
+    FrameReader,
+    ProtocolError,
+    decode_chat,
+    decode_response,
+    encode_frame,
+    encode_request,
+    encode_room_frame
+)
+
+correlation_ids = itertools.count(1)
+KEEPALIVE_INTERVAL: float = 15.0
+MAX_MESSAGE_LENGTH: int = 512
+INPUT_CHUNK_SIZE: int = 1 << 16
+RENDER_INTERVAL: float = 1 / 30
+
+BATCH_CREDIT: int = 16
+BATCH_SYNC_PERIOD: float = 0.5
+BATCH_MIN_RATE: float = 1.0
+BATCH_RATE_BACKOFF: float = 0.9
+BATCH_RATE_GROWTH: float = 1.5
+BATCH_RATE_STEP: float = 0.01
+BATCH_RETRY_DELAY: float = 0.25
+BATCH_MAX_RETRY_DELAY: float = 4.0
+
+EXIT_OK: int = 0
+EXIT_PARTIAL: int = 1
+EXIT_CONNECTION: int = 3
+EXIT_REJECTED: int = 4
+
+input_source = None
+
+class FileInput(object):
+    def __init__(self, file) -> None:
+        self.file = file
+        
+        
+    async def read(self, n: int = -1) -> bytes:
+        return self.file.read(n)
+    
+    
+    async def readline(self) -> bytes:
+        return self.file.readline()
+
+async def open_input(path: str | None = None):
+    if path is not None:
+        return FileInput(open(path, "rb"))
+    
+    if stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+        return FileInput(sys.stdin.buffer)
+    
+    reader = asyncio.StreamReader()
+    loop = asyncio.get_running_loop()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    return reader
+
+class ScriptInput(object):
+    def __init__(self, reader) -> None:
+        self.reader = reader
+        
+        
+    @classmethod
+    async def open(cls, path: str | None = None) -> "ScriptInput":
+        return cls(reader=await open_input(path=path))
+    
+    
+    async def __call__(self, prompt: str = "") -> str:
+        line: bytes = await self.reader.readline()
+        if not line:
+            raise EOFError
+        
+        text: str = line.decode().rstrip("\r\n")
+        print(f"{prompt}{text}")
+        return text
+
+async def prompt_input(prompt: str = "") -> str:
+    global input_source
+    if input_source is None:
+        from aioconsole import ainput
+        input_source = ainput
+        
+    return await input_source(prompt)
+
+async def read_reply(frames: FrameReader) -> Frame | None:
+    while True:
+        frame: Frame | None = await frames.read()
+        if frame is None or frame.type == FRAME_TEXT:
+            return frame
+
+async def request(
+    frames: FrameReader,
+    writer: asyncio.StreamWriter,
+    command: str,
+    argument: str = "",
+) -> tuple[int, str]:
+    correlation_id: int = next(correlation_ids)
+    writer.write(encode_request(correlation_id, command, argument))
+    await writer.drain()
+    
+    error: str | None = None
+    while True:
+        frame: Frame | None = await frames.read()
+        if frame is None:
+            raise ConnectionResetError(error or "server closed the connection")
+        
+        if frame.type == FRAME_ERROR:
+            error = frame.text()
+            continue
+        
+        if frame.type != FRAME_RESPONSE:
+            continue
+        
+        response_id, status, body = decode_response(frame.payload)
+        if response_id == correlation_id:
+            return status, body.decode()
+
+async def keepalive(writer: asyncio.StreamWriter, interval: float = KEEPALIVE_INTERVAL) -> None:
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            writer.write(encode_frame(FRAME_CONTROL, PING))
+            await writer.drain()
+            
+    except (asyncio.CancelledError, ConnectionError):
+        pass
+
+class Subscriptions(object):
+    def __init__(self, room_id: str, username: str) -> None:
+        self.username = username
+        self.active = room_id
+        self.rooms: set[str] = {room_id}
+        self.pending: dict[int, tuple[str, str]] = {}
+        self.multiplexed = False
+        
+        
+    def prompt(self) -> str:
+        return f"\t[Chatting] [#{self.active}] {self.username}: "
+    
+    
+    def request(self, writer: asyncio.StreamWriter, command: str, argument: str = "") -> None:
+        correlation_id: int = next(correlation_ids)
+        self.pending[correlation_id] = (command, argument)
+        writer.write(encode_request(correlation_id, command, argument))
+        
+        
+    def encode_message(self, message: str) -> bytes:
+        chat_frame: bytes = encode_frame(FRAME_CHAT, message.encode())
+        if self.multiplexed and self.active:
+            return encode_room_frame(self.active, chat_frame)
+        
+        return chat_frame
+    
+    
+    def close_room(self, room_id: str) -> str:
+        self.rooms.discard(room_id)
+        if self.active == room_id:
+            self.active = next(iter(sorted(self.rooms)), "")
+            
+        if not self.active:
+            return f"🚫 #{room_id} has been removed, use /exit to go back."
+        
+        return f"🚫 #{room_id} has been removed, your messages now go to #{self.active}."
+    
+    
+    def settle(self, correlation_id: int, status: int, body: str) -> str | None:
+        command, room_id = self.pending.pop(correlation_id, ("", ""))
+        if status == STATUS_RATE_LIMITED:
+            return f"⚠️  {body}"
+        
+        match command:
+            case "/history":
+                if status == STATUS_OK and body == "0":
+                    return "📜 There are no older messages in this room."
+                
+            case "/join" if status == STATUS_OK:
+                self.rooms.add(room_id)
+                self.active = room_id
+                self.multiplexed = True
+                return f"🥂 Following #{room_id} ({body}), your messages now go there."
+            
+            case "/switch" if status == STATUS_OK:
+                self.active = room_id
+                return f"💬 Your messages now go to #{room_id} ({body})."
+            
+            case "/leave" if status == STATUS_OK:
+                self.rooms.discard(room_id)
+                self.active = body
+                if not body:
+                    return f"👋 Left #{room_id}, you are not in any room now, use /exit to go back."
+                
+                return f"👋 Left #{room_id}, your messages now go to #{body}."
+            
+            case "/join" | "/switch" | "/leave":
+                if status == STATUS_NO_AVAILABLE_ROOM:
+                    return f"🚫 The room #{room_id} doesn't exists."
+                
+                if status == STATUS_ROOM_REMOVING:
+                    return f"🚫 The room #{room_id} is being removed."
+                
+                return f"🚫 {body}"
+            
+        return None
 
 async def send_message(
     writer: asyncio.StreamWriter,
-    room_id: str,
-    username: str,
+    subscriptions: Subscriptions,
 ) -> bool:
     try:
         while True:
-            message: str = await ainput(f"\t[Chatting] [#{room_id}] {username}: ")
-            if len(message) > 512:
+            try:
+                message: str = await prompt_input(subscriptions.prompt())
+            except EOFError:
+                writer.write(encode_frame(FRAME_CONTROL, EXIT_ROOM))
+                await writer.drain()
+                return True
+            
+            if len(message) > MAX_MESSAGE_LENGTH:
                 print("\n\t🚫 Please try again, Messages must be no more than 512 characters long.\n")
                 continue
                 
             if "/" in message:
-                match message:
+                command, _, argument = message.partition(" ")
+                argument = argument.strip()
+                match command:
                     case "/help":
                         print("\n\tList all commands for help command (in chat mode)")
                         print("\t✨ `/help` for list all commands that can using in chat cli (in chat mode).")
-                        print("\t✨ `/exit` for exit from currently chat room.\n")
+                        print("\t✨ `/history <n>` for show older messages from currently chat room.")
+                        print("\t✨ `/join <room id>` for follow another room too, your messages go to the room joined last.")
+                        print("\t✨ `/switch <room id>` for send your messages to another followed room.")
+                        print("\t✨ `/leave [room id]` for stop following a room (currently chat room by default).")
+                        print("\t✨ `/exit` for exit from all followed chat rooms.\n")
+                        continue
+                    
+                    case "/history":
+                        subscriptions.request(writer, "/history", argument)
+                        await writer.drain()
+                        continue
+                    
+                    case "/join" | "/switch" | "/leave":
+                        room_id: str = (argument or (subscriptions.active if command == "/leave" else "")).upper()
+                        if not room_id:
+                            print(f"\t❓ Please try again with a room id, `{command} <room id>`.")
+                            continue
+                        
+                        subscriptions.request(writer, command, room_id)
+                        await writer.drain()
                         continue
                     
                     case "/exit":
-                        writer.write(b"[#exit_room]")
+                        writer.write(encode_frame(FRAME_CONTROL, EXIT_ROOM))
                         await writer.drain()
                         
-                        print(f"\n\t✅ Exit from `{room_id}` successfully\n")
+                        print(f"\n\t✅ Exit from `{', '.join(sorted(subscriptions.rooms)) or subscriptions.active}` successfully\n")
                         return True
                     
                     case _:
@@ -36,82 +288,155 @@ async def send_message(
                         continue
             
             else:
-                writer.write(message.encode())
+                writer.write(subscriptions.encode_message(message))
                 await writer.drain()
                 
     except asyncio.CancelledError:
         pass
         
+class TerminalView(object):
+    def __init__(self, prompt: str, interval: float = RENDER_INTERVAL) -> None:
+        self.prompt = prompt
+        self.interval = interval
+        self.lines: list[str] = []
+        self.handle: asyncio.TimerHandle | None = None
+        
+        
+    def add(self, line: str) -> None:
+        self.lines.append(line)
+        if self.handle is None:
+            self.handle = asyncio.get_running_loop().call_later(self.interval, self.render)
+    
+    
+    def render(self) -> None:
+        self.handle = None
+        if not self.lines:
+            return
+        
+        # One write per interval keeps a burst of messages from redrawing the prompt line for every message.
+        output = ["\r", " " * 80, "\r"]
+        for line in self.lines:
+            output.append(f"\t{line}\n")
+        
+        output.append(self.prompt)
+        self.lines.clear()
+        
+        sys.stdout.write("".join(output))
+        sys.stdout.flush()
+    
+    
+    def close(self) -> None:
+        if self.handle is not None:
+            self.handle.cancel()
+        
+        self.render()
+
 async def receive_message(
-    reader: asyncio.StreamReader,
-    room_id: str,
-    username: str,
+    frames: FrameReader,
+    writer: asyncio.StreamWriter,
+    subscriptions: Subscriptions,
 ) -> None:
+    view = TerminalView(prompt=subscriptions.prompt())
     try:
         while True:
-            stream_data = await reader.read(1024)
-            if not stream_data:
+            frame: Frame | None = await frames.read()
+            if frame is None:
                 break
             
-            if username.encode() in stream_data:
+            if frame.type == FRAME_CONTROL and frame.payload == PING:
+                writer.write(encode_frame(FRAME_CONTROL, PONG))
                 continue
-            else: 
-                sys.stdout.write('\r' + ' ' * 80 + '\r')
-
-                print(f"\t{stream_data.decode().strip()}")
-
-                sys.stdout.write(f"\t[Chatting] [#{room_id}] {username}: ")
-                sys.stdout.flush()
+            
+            if frame.type == FRAME_ERROR:
+                # The server only tags an error with a room when that room has gone away.
+                view.add(subscriptions.close_room(frame.room) if frame.room else f"⚠️  {frame.text()}")
+                view.prompt = subscriptions.prompt()
+                continue
+            
+            if frame.type == FRAME_RESPONSE:
+                correlation_id, status, body = decode_response(frame.payload)
+                notice: str | None = subscriptions.settle(correlation_id=correlation_id, status=status, body=body.decode())
+                if notice is not None:
+                    view.add(notice)
+                    view.prompt = subscriptions.prompt()
+                
+                continue
+            
+            if frame.type != FRAME_CHAT:
+                continue
+            
+            sender, text = decode_chat(frame.payload)
+            if sender == subscriptions.username:
+                continue
+            
+            line: str = text.decode(errors="replace").strip()
+            view.add(f"[#{frame.room}] {line}" if frame.room else line)
                 
     except asyncio.CancelledError:
         pass
     
+    finally:
+        view.close()
+    
     return
 
-async def username_prompt(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str:
-    stream_data = await reader.read(24)
-    if b"[#ask_username_prompt]" in stream_data:
+async def username_prompt(frames: FrameReader, writer: asyncio.StreamWriter) -> str:
+    frame: Frame | None = await frames.read()
+    if frame is None:
+        raise ConnectionResetError("server closed the connection")
+    
+    if frame.type == FRAME_ERROR:
+        raise ConnectionResetError(frame.text())
+    
+    if frame.type == FRAME_CONTROL and frame.payload == ASK_USERNAME_PROMPT:
+        await request(frames=frames, writer=writer, command="/compress", argument=COMPRESSION_ZLIB)
+        
         while True:
             username: str = ""
             while len(username) < 5 or len(username) > 16:
-                username = await ainput("\tLet's we know about your username ❓\n\t→ ")
+                username = await prompt_input("\tLet's we know about your username ❓\n\t→ ")
                 if len(username) < 5:
                     print("\n\t🚫 Please try again, Username must be no less than 5 characters long.")
                     
                 elif len(username) > 16:
                     print("\n\t🚫 Please try again, Username must be no more than 16 characters long.")
                 
-            writer.write(username.encode())
-            await writer.drain()
-            
             print(f"\n\t🌱 Verifying the username ({username})...")
-            await asyncio.sleep(1)
             
-            stream_data = await reader.read(42)
-            if b"[#duplicated_username]" in stream_data:
+            status, body = await request(frames=frames, writer=writer, command="/username", argument=username)
+            if status == STATUS_RATE_LIMITED:
+                print(f"\n\t🚫 {body}\n")
+                continue
+            
+            if status == STATUS_DUPLICATED_USERNAME:
                 print("\n\t🚫 Please try again, The username was taken.\n")
                 continue
             
-            if b"[#verified_username]" in stream_data:
+            if status == STATUS_OK:
                 break
             
     return username
 
 async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    frames = FrameReader(reader, inflate=True)
+    keepalive_task = asyncio.create_task(keepalive(writer=writer))
     try:
         print("\n\t🎉 Chat CLI [v1.0.0]")
         print("\tBefore you use our Chat CLI, you need to set up a name for yourself.\n")
-        username = await username_prompt(reader=reader, writer=writer)
+        username = await username_prompt(frames=frames, writer=writer)
         
         print("\n\t🌱 Retriving initial data and all chat rooms...\n\n\t", end="")
-        await asyncio.sleep(1)
         
-        stream_data = await reader.read(4096)
-        print(stream_data.decode().replace("t]", ""))
+        for _ in range(2):
+            frame = await read_reply(frames)
+            if frame is None:
+                raise ConnectionResetError("server closed the connection")
+            
+            print(frame.text())
         
         while True:
             try:
-                command_executor: str = await ainput(f"\t[Idle] {username} ~ → ")
+                command_executor: str = await prompt_input(f"\t[Idle] {username} ~ → ")
             except EOFError:
                 print("\t❌ Input stream closed. Exiting...")
                 break
@@ -121,69 +446,58 @@ async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.Stream
                     print("\n\tList all commands for help command (in idle mode)")
                     print("\t✨ `/help` for list all commands that can using in chat cli (in idle mode).")
                     print("\t✨ `/list` for list all rooms available in chat server.")
+                    print("\t✨ `/list page <n>` or `/list filter <text>` for browse or search the rooms.")
                     print("\t✨ `/connect` for connect a chat room by room id.")
                     print("\t✨ `/create` for create a room.")
                     print("\t✨ `/remove` for remove a room.")
                     print("\t✨ `/exit` for exit from chat cli.\n")
                     
-                case "/list":
-                    writer.write(command_executor.encode())
-                    await writer.drain()
-                    
-                    stream_data = await reader.read(8196)
-                    print(stream_data.decode())
+                case listing if listing == "/list" or listing.startswith("/list "):
+                    _, _, listing_option = listing.partition(" ")
+                    _, room_listing = await request(frames=frames, writer=writer, command="/list", argument=listing_option.strip())
+                    print(room_listing)
                     
                 case "/connect":
-                    writer.write(command_executor.encode())
-                    await writer.drain()
-                    
                     print("\n\t🧭 Select a room for create a conversation by entering the room id")
                     
                     room_id: str = ""
                     try:
-                        room_id = await ainput(f"\t(Using the room id) → ")
+                        room_id = await prompt_input(f"\t(Using the room id) → ")
                     except EOFError:
                         print("\t❌ Input stream closed. Exiting...")
                         break
                     
-                    writer.write(room_id.encode())
-                    await writer.drain()
-                    
+                    room_id = room_id.strip().upper()
                     print(f"\n\t🌱 Checking availability...")
-                    await asyncio.sleep(1)
                     
-                    stream_data = await reader.read(64)
-                    if b"[#no_available_room]" in stream_data:
-                        print("\n\t🚫 The room doesn't exists, Please try again.\n")
+                    status, body = await request(frames=frames, writer=writer, command="/connect", argument=room_id)
+                    if status == STATUS_RATE_LIMITED:
+                        print(f"\n\t🚫 {body}\n")
                         continue
                     
-                    print(f"\t🌱 Checking the room status...\n")
-                    await asyncio.sleep(1)
+                    if status == STATUS_NO_AVAILABLE_ROOM:
+                        print("\n\t🚫 The room doesn't exists, Please try again.\n")
+                        continue
                     
-                    stream_data = await reader.read(64)
-                    if b"[#room_removing]" in stream_data:
+                    if status == STATUS_ROOM_REMOVING:
                         print("\t🚫 The room doesn't open because the room is removing, Please try again.\n")
                         continue
                     
-                    writer.write(username.encode())
-                    await writer.drain()
-                    
                     print("\t📣 In chatting, You can use commands. If you don't know the command, use `/help` for help.")
                     print("\tIf you want to exit from this room, Use `/exit` to exit this chat room.\n")
-                    print(f"\t🥂 {username} has joined the chat room.\n")
                     
+                    subscriptions = Subscriptions(room_id=room_id, username=username)
                     send_task = asyncio.create_task(
                         send_message(
                             writer=writer,
-                            username=username,
-                            room_id=room_id,
+                            subscriptions=subscriptions,
                         )
                     )
                     receive_task = asyncio.create_task(
                         receive_message(
-                            reader=reader,
-                            username=username,
-                            room_id=room_id,
+                            frames=frames,
+                            writer=writer,
+                            subscriptions=subscriptions,
                         )
                     )
                     
@@ -201,56 +515,47 @@ async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.Stream
                         pass
                     
                 case "/create":
-                    writer.write(command_executor.encode())
-                    await writer.drain()
-                    
                     print("\n\t🔮 Before create a room, You must set a room title to describe about your room")
                     room_title: str = ""
                     try:
-                        room_title = await ainput(f"\t(Your room title) → ")
+                        room_title = await prompt_input(f"\t(Your room title) → ")
                     except EOFError:
                         print("\t❌ Input stream closed. Exiting...")
                         break
                     
-                    writer.write(room_title.encode())
-                    await writer.drain()
-                    
                     print(f"\n\t🌱 Creating `{room_title}` room, Please wait for a moment...")
-                    await asyncio.sleep(2)
                     
-                    stream_data = await reader.read(128)
-                    if b"[#create_room_successfully]" in stream_data:
-                        print(f"\n\t✅ Create `{room_title}` room was successfully!\n")
+                    status, created_room_id = await request(frames=frames, writer=writer, command="/create", argument=room_title)
+                    if status == STATUS_OK:
+                        print(f"\n\t✅ Create `{room_title}` room was successfully! (ID: {created_room_id})\n")
+                    else:
+                        print("\n\t🚫 Unable to create the room, Please try again with a room title.\n")
                         
                 case "/remove":
-                    writer.write(command_executor.encode())
-                    await writer.drain()
-                    
                     print("\n\t🔮 Before remove a room, You must specific a room id that do you want to remove")
                     room_id: str = ""
                     try:
-                        room_id = await ainput(f"\t(Using the room id) → ")
+                        room_id = await prompt_input(f"\t(Using the room id) → ")
                     except EOFError:
                         print("\t❌ Input stream closed. Exiting...")
                         break
                     
-                    writer.write(room_id.encode())
-                    await writer.drain()
-                    
+                    room_id = room_id.strip().upper()
                     print(f"\n\t🌱 Chat room deletion is in progress (#{room_id}), Please wait a moment...")
-                    await asyncio.sleep(1)
                     
-                    stream_data = await reader.read(1024)
-                    if b"[#no_available_room]" in stream_data:
-                        print("\n\t🚫 The room doesn't exists, Please try again.")
+                    status, body = await request(frames=frames, writer=writer, command="/remove", argument=room_id)
+                    if status == STATUS_RATE_LIMITED:
+                        print(f"\n\t🚫 {body}\n")
                         continue
                     
-                    await asyncio.sleep(1)
+                    if status == STATUS_NO_AVAILABLE_ROOM:
+                        print("\n\t🚫 The room doesn't exists, Please try again.")
+                        continue
                     
                     print(f"\t✅ The room removed for #{room_id} was successfully!\n")
                     
                 case "/exit":
-                    writer.write(b"[#exit_cli]")
+                    writer.write(encode_frame(FRAME_CONTROL, EXIT_CLI))
                     await writer.drain()
                     
                     print("\n\t📅 Exiting from chat CLI...\n")
@@ -263,6 +568,7 @@ async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.Stream
                     print("\t❓ Please try again beacuse no such found the command to execution. (hint: /help)")
 
     finally:
+        keepalive_task.cancel()
         print("\n\t🔒 Disconnecting from the server...")
         
         writer.close()
@@ -270,20 +576,395 @@ async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.Stream
         
         print("\n\t✅ Disconnected successfully!")
 
-async def main():
+class BatchSession(object):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, ack_every: int, window: int) -> None:
+        self.writer = writer
+        self.frames = FrameReader(reader, inflate=True)
+        self.ack_every = max(ack_every, 1)
+        self.window = max(window, 1)
+        
+        self.responses: dict[int, asyncio.Future] = {}
+        self.syncs: deque[asyncio.Future] = deque()
+        self.outgoing = bytearray()
+        self.room_id: str | None = None
+        self.created_room_id: str | None = None
+        self.error: str | None = None
+        
+        self.sent = 0
+        self.unsynced = 0
+        self.skipped = 0
+        self.accepted = 0
+        self.throttled = 0
+        self.baseline = (0, 0)
+        
+        # Messages sent before the last answered /sync, and how many more may be in flight before the next one.
+        self.settled = 0
+        self.credit = min(BATCH_CREDIT, self.ack_every * self.window)
+        # Messages per second once the server throttled the batch, 0 until then, and the rate it last throttled.
+        self.rate = 0.0
+        self.threshold = 0.0
+        self.next_send = 0.0
+        
+        self.task = asyncio.create_task(self.__receive_forever())
+        
+        
+    async def __receive_forever(self) -> None:
+        try:
+            while True:
+                frame: Frame | None = await self.frames.read()
+                if frame is None:
+                    break
+                
+                if frame.type == FRAME_CONTROL and frame.payload == PING:
+                    self.writer.write(encode_frame(FRAME_CONTROL, PONG))
+                    
+                elif frame.type == FRAME_ERROR:
+                    self.error = frame.text()
+                    
+                elif frame.type == FRAME_RESPONSE:
+                    correlation_id, status, body = decode_response(frame.payload)
+                    response = self.responses.pop(correlation_id, None)
+                    if response is not None and not response.done():
+                        response.set_result((status, body.decode()))
+                        
+        except (ConnectionError, ProtocolError) as e:
+            self.error = self.error or str(e)
+            
+        for response in self.responses.values():
+            if not response.done():
+                response.set_exception(ConnectionResetError(self.error or "server closed the connection"))
+                
+        self.responses.clear()
+        
+        
+    def __send_request(self, command: str, argument: str = "") -> asyncio.Future:
+        correlation_id: int = next(correlation_ids)
+        response = asyncio.get_running_loop().create_future()
+        self.responses[correlation_id] = response
+        
+        self.outgoing += encode_request(correlation_id, command, argument)
+        return response
+    
+    
+    async def __flush(self) -> None:
+        if self.outgoing:
+            self.writer.write(self.outgoing)
+            self.outgoing = bytearray()
+            
+        await self.writer.drain()
+        
+        
+    async def request(self, command: str, argument: str = "") -> tuple[int, str]:
+        delay: float = BATCH_RETRY_DELAY
+        while True:
+            response = self.__send_request(command=command, argument=argument)
+            await self.__flush()
+            status, body = await response
+            if status != STATUS_RATE_LIMITED:
+                return status, body
+            
+            # A throttled request was not run, so it is sent again once the limits had time to refill.
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BATCH_MAX_RETRY_DELAY)
+            
+            
+    def __record_sync(self, response: asyncio.Future, sent: int) -> None:
+        if response.cancelled() or response.exception() is not None:
+            return
+        
+        status, body = response.result()
+        counts: list[str] = body.split()
+        if status != STATUS_OK or len(counts) != 2 or not all(count.isdigit() for count in counts):
+            return
+        
+        accepted, throttled = (int(count) - baseline for count, baseline in zip(counts, self.baseline))
+        accepted_since, throttled_since = accepted - self.accepted, throttled - self.throttled
+        
+        self.accepted, self.throttled, self.settled = accepted, throttled, sent
+        
+        # The server drops what it throttles and disconnects clients that keep at it, so the batch paces itself.
+        # It speeds up quickly until a paced send is throttled, then stays below the share that got through and
+        # creeps up while nothing is dropped. An unpaced burst says nothing about the limit, so pacing starts low.
+        if throttled_since and self.rate:
+            passed: float = accepted_since / (accepted_since + throttled_since)
+            self.rate = self.threshold = max(self.rate * passed * BATCH_RATE_BACKOFF, BATCH_MIN_RATE)
+        elif throttled_since:
+            self.rate = BATCH_MIN_RATE
+            self.next_send = time.monotonic() + 1 / self.rate
+        elif self.rate and self.threshold:
+            self.rate += max(self.rate * BATCH_RATE_STEP, BATCH_MIN_RATE / 2)
+        elif self.rate:
+            self.rate *= BATCH_RATE_GROWTH
+            
+        # Paced batches wait for short acknowledgements, which bounds what a single overshoot can lose.
+        if self.rate:
+            self.credit = min(max(int(self.rate * BATCH_SYNC_PERIOD), 1), BATCH_CREDIT)
+        else:
+            self.credit = min(self.credit * 2, self.ack_every * self.window)
+        
+        
+    def __request_sync(self) -> None:
+        response = self.__send_request(command="/sync")
+        response.add_done_callback(lambda response, sent=self.sent: self.__record_sync(response, sent=sent))
+        self.syncs.append(response)
+        self.unsynced = 0
+        
+        
+    def __needs_sync(self) -> bool:
+        return self.unsynced >= min(self.ack_every, self.credit)
+    
+    
+    async def sync(self, wait: bool = False) -> None:
+        if self.unsynced or wait:
+            self.__request_sync()
+            
+        await self.__flush()
+        
+        delay: float = BATCH_RETRY_DELAY
+        while wait or len(self.syncs) > self.window or self.sent - self.settled >= self.credit:
+            if not self.syncs:
+                if self.settled >= self.sent:
+                    break
+                
+                # The last /sync was refused by the address limit, so nothing it covered is settled yet.
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, BATCH_MAX_RETRY_DELAY)
+                self.__request_sync()
+                await self.__flush()
+                
+            await self.syncs.popleft()
+            
+            
+    async def __pace(self) -> None:
+        if not self.rate:
+            return
+        
+        now: float = time.monotonic()
+        delay: float = self.next_send - now
+        self.next_send = max(self.next_send, now) + 1 / self.rate
+        if delay > 0:
+            await self.__flush()
+            await asyncio.sleep(delay)
+            
+            
+    async def login(self, username: str) -> int:
+        self.__send_request(command="/compress", argument=COMPRESSION_ZLIB)
+        status, _ = await self.request(command="/username", argument=username)
+        if status != STATUS_OK:
+            print(f"🚫 The username `{username}` was rejected (status {status}).", file=sys.stderr)
+            return EXIT_REJECTED
+        
+        status, body = await self.request(command="/sync")
+        self.baseline = tuple(int(count) for count in body.split()) if status == STATUS_OK else (0, 0)
+        return EXIT_OK
+    
+    
+    def send_message(self, message: str) -> None:
+        if self.room_id is None or len(message) > MAX_MESSAGE_LENGTH:
+            self.skipped += 1
+            return
+        
+        self.outgoing += encode_frame(FRAME_CHAT, message.encode())
+        self.sent += 1
+        self.unsynced += 1
+        
+        
+    def __leave_room(self) -> None:
+        if self.room_id is not None:
+            self.outgoing += encode_frame(FRAME_CONTROL, EXIT_ROOM)
+            self.room_id = None
+            
+            
+    async def run_command(self, line: str) -> int:
+        command, _, argument = line.partition(" ")
+        argument = argument.strip()
+        
+        match command:
+            case "/connect":
+                room_id: str = (argument or self.created_room_id or "").upper()
+                self.__leave_room()
+                status, body = await self.request(command="/connect", argument=room_id)
+                if status != STATUS_OK:
+                    print(f"🚫 Unable to connect to `{room_id}` (status {status}).", file=sys.stderr)
+                    return EXIT_REJECTED
+                
+                self.room_id = room_id
+                return EXIT_OK
+            
+            case "/join" | "/switch" | "/leave":
+                room_id = argument.upper()
+                status, body = await self.request(command=command, argument=room_id)
+                if status != STATUS_OK:
+                    print(f"🚫 `{line}` was rejected (status {status}).", file=sys.stderr)
+                    return EXIT_REJECTED
+                
+                self.room_id = (body or None) if command == "/leave" else room_id
+                return EXIT_OK
+            
+            case "/exit":
+                self.__leave_room()
+                return EXIT_OK
+            
+            case "/create":
+                status, body = await self.request(command="/create", argument=argument)
+                if status != STATUS_OK:
+                    print(f"🚫 Unable to create `{argument}` (status {status}).", file=sys.stderr)
+                    return EXIT_REJECTED
+                
+                self.created_room_id = body
+                print(body)
+                return EXIT_OK
+            
+            case "/remove" | "/list":
+                status, body = await self.request(command=command, argument=argument.upper() if command == "/remove" else argument)
+                if status != STATUS_OK:
+                    print(f"🚫 `{line}` was rejected (status {status}).", file=sys.stderr)
+                    return EXIT_REJECTED
+                
+                if body:
+                    print(body)
+                    
+                return EXIT_OK
+            
+            case "/sync":
+                await self.sync(wait=True)
+                return EXIT_OK
+            
+            case _:
+                print(f"🚫 `{command}` is not available in batch mode.", file=sys.stderr)
+                return EXIT_REJECTED
+            
+            
+    async def stream(self, source) -> int:
+        pending: bytes = b""
+        while True:
+            chunk: bytes = await source.read(INPUT_CHUNK_SIZE)
+            lines: list[bytes]
+            if chunk:
+                *lines, pending = (pending + chunk).split(b"\n")
+            else:
+                lines, pending = [pending], b""
+                
+            for line in lines:
+                text: str = line.decode(errors="replace").rstrip("\r")
+                if not text.strip():
+                    continue
+                
+                if not text.startswith("/"):
+                    await self.__pace()
+                    self.send_message(text)
+                    if self.__needs_sync():
+                        await self.sync()
+                        
+                    continue
+                
+                await self.sync()
+                exit_code: int = await self.run_command(text.strip())
+                if exit_code != EXIT_OK:
+                    return exit_code
+                
+            if not chunk:
+                break
+            
+            await self.sync()
+            
+        await self.sync(wait=True)
+        self.__leave_room()
+        self.outgoing += encode_frame(FRAME_CONTROL, EXIT_CLI)
+        await self.__flush()
+        return EXIT_OK
+    
+    
+    async def close(self) -> None:
+        self.writer.close()
+        await asyncio.gather(self.task, return_exceptions=True)
+        try:
+            await self.writer.wait_closed()
+            
+        except ConnectionError:
+            pass
+
+async def run_batch(arguments: argparse.Namespace) -> int:
+    try:
+        source = await open_input(path=arguments.script)
+        reader, writer = await asyncio.open_connection(arguments.host, arguments.port)
+        
+    except OSError as e:
+        print(f"🚫 Unable to start the batch: {e}", file=sys.stderr)
+        return EXIT_CONNECTION
+    
+    session = BatchSession(reader=reader, writer=writer, ack_every=arguments.ack_every, window=arguments.window)
+    started: float = time.perf_counter()
+    try:
+        exit_code: int = await session.login(username=arguments.username)
+        if exit_code == EXIT_OK and arguments.room is not None:
+            exit_code = await session.run_command(f"/connect {arguments.room}")
+            
+        if exit_code == EXIT_OK:
+            exit_code = await session.stream(source=source)
+            
+    except (ConnectionError, ProtocolError) as e:
+        print(f"🚫 Lost the connection to the server: {session.error or e}", file=sys.stderr)
+        exit_code = EXIT_CONNECTION
+        
+    finally:
+        await session.close()
+        
+    elapsed: float = time.perf_counter() - started
+    print(
+        f"📤 sent {session.sent} messages, {session.accepted} acked, {session.throttled} throttled, "
+        f"{session.skipped} skipped in {elapsed:.3f} s ({session.accepted / max(elapsed, 1e-9):.0f} acked messages/s)",
+        file=sys.stderr
+    )
+    
+    if exit_code == EXIT_OK and (session.skipped or session.accepted < session.sent):
+        exit_code = EXIT_PARTIAL
+        
+    return exit_code
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Chat CLI client")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--loop", default="auto", choices=LOOP_BACKENDS, help="event loop backend, auto prefers uvloop when it is installed")
+    parser.add_argument("--script", default=None, help="read the input from this file instead of the terminal; piped input is read the same way")
+    parser.add_argument("--batch", action="store_true", help="stream newline-delimited messages and commands without prompts, then exit with a status code")
+    parser.add_argument("--username", default=None, help="username used by --batch")
+    parser.add_argument("--room", default=None, help="room id joined by --batch before reading the input")
+    parser.add_argument("--ack-every", type=int, default=256, help="messages sent by --batch between acknowledgements")
+    parser.add_argument("--window", type=int, default=8, help="acknowledgements --batch may wait for at once")
+    
+    arguments = parser.parse_args()
+    if arguments.batch and not arguments.username:
+        parser.error("--batch needs a --username")
+        
+    return arguments
+
+async def main(arguments: argparse.Namespace):
+    global input_source
     try:
-        reader, writer = await asyncio.open_connection('localhost', 9000)
+        if arguments.script is not None or not sys.stdin.isatty():
+            input_source = await ScriptInput.open(path=arguments.script)
+            
+        reader, writer = await asyncio.open_connection(arguments.host, arguments.port)
         await handle_connection(reader, writer)
         
     except ConnectionRefusedError:
         print("\n\tUnable to connect to the server. Is it running?")
         
+    except EOFError:
+        print("\n\tThe input ended before the session started.")
+        
+    except (ConnectionResetError, ProtocolError) as e:
+        print(f"\n\tLost the connection to the server: {e}")
+        
     except asyncio.CancelledError:
         print("\n\tClient operation cancelled.")
 
 if __name__ == "__main__":
-    loop = asyncio.new_event_loop()
-    main_task = loop.create_task(main())
+    arguments = parse_arguments()
+    loop, _ = new_event_loop(backend=arguments.loop)
+    main_task = loop.create_task(run_batch(arguments=arguments) if arguments.batch else main(arguments=arguments))
     
     def signal_handler():
         main_task.cancel()
@@ -291,11 +972,14 @@ if __name__ == "__main__":
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, signal_handler)
     
+    exit_code: int | None = None
     try:
-        loop.run_until_complete(main_task)
+        exit_code = loop.run_until_complete(main_task)
         
     except asyncio.CancelledError:
-        pass
+        exit_code = 130 if arguments.batch else None
     
     finally:
-        loop.close()
\ No newline at end of file
+        loop.close()
+        
+    sys.exit(exit_code)
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import socket
+import struct
+import asyncio
+
+HANDOFF_HEADER = struct.Struct("!II")
+HANDOFF_ACK: bytes = b"\x06"
+MAX_FDS_PER_MESSAGE: int = 253
+
+def receive_exactly(connection: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        data: bytes = connection.recv(min(size - len(buffer), 1 << 20))
+        if not data:
+            raise ConnectionResetError("the handoff peer closed the connection")
+
+        buffer += data
+
+    return bytes(buffer)
+
+def send_handoff(connection: socket.socket, fds: list[int], payload: bytes) -> None:
+    connection.sendall(HANDOFF_HEADER.pack(len(fds), len(payload)))
+    for start in range(0, len(fds), MAX_FDS_PER_MESSAGE):
+        socket.send_fds(connection, [b"\x00"], fds[start:start + MAX_FDS_PER_MESSAGE])
+
+    connection.sendall(payload)
+    if connection.recv(1) != HANDOFF_ACK:
+        raise ConnectionResetError("the successor did not acknowledge the handoff")
+
+def receive_handoff(connection: socket.socket) -> tuple[list[int], bytes]:
+    fd_count, payload_size = HANDOFF_HEADER.unpack(receive_exactly(connection, HANDOFF_HEADER.size))
+
+    fds: list[int] = []
+    while len(fds) < fd_count:
+        data, received_fds, _, _ = socket.recv_fds(connection, 1, min(fd_count - len(fds), MAX_FDS_PER_MESSAGE))
+        if not data:
+            raise ConnectionResetError("the handoff peer closed the connection")
+
+        fds.extend(received_fds)
+
+    payload: bytes = receive_exactly(connection, payload_size)
+    connection.sendall(HANDOFF_ACK)
+    return fds, payload
+
+async def accept_successor(path: str) -> socket.socket:
+    if os.path.exists(path):
+        os.unlink(path)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    listener.setblocking(False)
+    try:
+        connection, _ = await asyncio.get_running_loop().sock_accept(listener)
+
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+    connection.setblocking(True)
+    return connection
+
+async def take_over(path: str) -> tuple[list[int], bytes]:
+    loop = asyncio.get_running_loop()
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        await loop.run_in_executor(None, connection.connect, path)
+        return await loop.run_in_executor(None, receive_handoff, connection)
+
+    finally:
+        connection.close()
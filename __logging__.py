@@ -0,0 +1,108 @@
+import sys
+import json
+import time
+import queue
+import logging
+import logging.handlers
+
+from datetime import datetime, timezone
+
+LOG_QUEUE_SIZE: int = 10_000
+LOG_MAX_BYTES: int = 16 << 20
+LOG_BACKUP_COUNT: int = 5
+RATE_LIMIT_INTERVAL: float = 1.0
+RATE_LIMIT_BURST: int = 10
+
+STANDARD_ATTRIBUTES: frozenset[str] = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+logger = logging.getLogger("chat")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, maxsize: int = LOG_QUEUE_SIZE) -> None:
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.dropped = 0
+
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+
+        except queue.Full:
+            self.dropped += 1
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval: float = RATE_LIMIT_INTERVAL, burst: int = RATE_LIMIT_BURST) -> None:
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.windows: dict[tuple[str, object], list] = {}
+
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.msg)
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window is not None else 0
+            self.windows[key] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+
+            return True
+
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+
+        window[2] += 1
+        return False
+
+def setup_logging(
+    level: str = "info",
+    path: str | None = None,
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+    queue_size: int = LOG_QUEUE_SIZE
+) -> logging.handlers.QueueListener:
+    if path is None:
+        output = logging.StreamHandler(sys.stderr)
+    else:
+        output = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+
+    output.setFormatter(JsonFormatter())
+
+    handler = BoundedQueueHandler(maxsize=queue_size)
+    handler.addFilter(RateLimitFilter())
+
+    logger.handlers.clear()
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
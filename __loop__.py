@@ -0,0 +1,37 @@
+import asyncio
+import importlib.util
+
+from __logging__ import logger
+
+LOOP_BACKENDS: tuple[str, ...] = ("auto", "asyncio", "uvloop")
+
+def available_loop_backends() -> list[str]:
+    backends = ["asyncio"]
+    if importlib.util.find_spec("uvloop") is not None:
+        backends.append("uvloop")
+
+    return backends
+
+def resolve_loop_backend(backend: str = "auto"):
+    if backend == "asyncio":
+        return None, "asyncio"
+
+    try:
+        import uvloop
+
+    except ImportError:
+        if backend == "uvloop":
+            logger.warning("uvloop is not installed, falling back to the asyncio event loop")
+
+        return None, "asyncio"
+
+    return uvloop.new_event_loop, "uvloop"
+
+def new_event_loop(backend: str = "auto") -> tuple[asyncio.AbstractEventLoop, str]:
+    loop_factory, name = resolve_loop_backend(backend)
+    return (loop_factory or asyncio.new_event_loop)(), name
+
+def run(main, backend: str = "auto"):
+    loop_factory, _ = resolve_loop_backend(backend)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(main)
@@ -0,0 +1,178 @@
+import time
+import bisect
+import asyncio
+
+LATENCY_BUCKETS: tuple[float, ...] = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+BATCH_BUCKETS: tuple[float, ...] = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+LOOP_LAG_INTERVAL: float = 0.5
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter(object):
+    __slots__ = ("name", "help", "label_names", "values")
+    type = "counter"
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values: dict[tuple, float] = {}
+
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self.values[labels] = value
+
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+class Gauge(Counter):
+    __slots__ = ()
+    type = "gauge"
+
+    def dec(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+class Histogram(object):
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def render(self) -> list[str]:
+        lines: list[str] = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {format_value(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class MetricsRegistry(object):
+    def __init__(self) -> None:
+        self.metrics: list[Counter | Histogram] = []
+
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+    def render(self) -> bytes:
+        lines: list[str] = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+
+        lines.append("")
+        return "\n".join(lines).encode()
+
+class ChatMetrics(MetricsRegistry):
+    __commands__: frozenset[str] = frozenset({"/username", "/list", "/connect", "/create", "/remove", "/stats", "/history", "/compress", "/sync", "/join", "/leave", "/switch"})
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.connections = self.register(Counter("chat_connections_total", "Accepted client connections."))
+        self.active_connections = self.register(Gauge("chat_connections_active", "Client connections currently open."))
+        self.commands = self.register(Counter("chat_commands_total", "Requests handled, by command.", ("command",)))
+        self.bytes_in = self.register(Counter("chat_received_bytes_total", "Bytes read from clients."))
+        self.bytes_out = self.register(Counter("chat_sent_bytes_total", "Bytes written to clients."))
+        self.fanout_seconds = self.register(Histogram("chat_broadcast_fanout_seconds", "Time spent queueing one message for every local participant."))
+        self.queue_depth = self.register(Gauge("chat_outbox_queue_depth", "Messages waiting in outboxes.", ("aggregate",)))
+        self.dropped = self.register(Counter("chat_outbox_dropped_total", "Messages dropped by the slow-consumer policy."))
+        self.drain_stall_seconds = self.register(Histogram("chat_drain_stall_seconds", "Time writers waited for the transport to drain."))
+        self.flush_batch_messages = self.register(Histogram("chat_outbox_flush_batch_messages", "Messages gathered into one socket write.", BATCH_BUCKETS))
+        self.rate_limited = self.register(Counter("chat_rate_limited_total", "Connections, requests and messages rejected by a rate limit, by scope.", ("scope",)))
+        self.flood_disconnects = self.register(Counter("chat_flood_disconnects_total", "Clients disconnected for repeatedly exceeding a rate limit."))
+        self.idle_reaped = self.register(Counter("chat_idle_reaped_total", "Connections closed by the idle timeout."))
+        self.loop_lag_seconds = self.register(Histogram("chat_event_loop_lag_seconds", "Delay of the event loop beyond a scheduled wakeup."))
+
+        self.closed_bytes_in = 0
+        self.closed_bytes_out = 0
+        self.closed_dropped = 0
+
+
+    def count_command(self, command: str) -> None:
+        self.commands.inc(labels=(command if command in self.__commands__ else "other",))
+
+
+    async def monitor_loop_lag(self, interval: float = LOOP_LAG_INTERVAL) -> None:
+        while True:
+            scheduled = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag_seconds.observe(max(time.perf_counter() - scheduled, 0.0))
+
+class MetricsServer(object):
+    def __init__(self, render, hostname: str, port: int) -> None:
+        self.render = render
+        self.hostname = hostname
+        self.port = port
+        self.server = None
+
+
+    async def __handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line: bytes = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+
+            method, _, rest = request_line.decode(errors="replace").partition(" ")
+            path = rest.split(" ", 1)[0]
+            if method == "GET" and path == "/metrics":
+                status, body = "200 OK", self.render()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.__handle_request, host=self.hostname, port=self.port)
+
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
@@ -0,0 +1,260 @@
+import zlib
+import struct
+import asyncio
+
+from collections import deque
+
+PROTOCOL_VERSION: int = 1
+MAX_PAYLOAD_SIZE: int = 1 << 20
+READ_CHUNK_SIZE: int = 1 << 16
+MAX_INFLATED_SIZE: int = 16 * MAX_PAYLOAD_SIZE
+
+FRAME_HEADER = struct.Struct("!BBI")
+REQUEST_HEADER = struct.Struct("!I")
+RESPONSE_HEADER = struct.Struct("!IB")
+BUS_EVENT_HEADER = struct.Struct("!BHH")
+CLAIM_HEADER = struct.Struct("!I")
+CLAIM_RESULT_HEADER = struct.Struct("!IB")
+CHAT_SENDER_HEADER = struct.Struct("!xB")
+ROOM_FRAME_HEADER = struct.Struct("!B")
+
+FRAME_CONTROL: int = 0x01
+FRAME_TEXT: int = 0x02
+FRAME_CHAT: int = 0x03
+FRAME_REQUEST: int = 0x04
+FRAME_RESPONSE: int = 0x05
+FRAME_ERROR: int = 0x06
+FRAME_DEFLATE: int = 0x07
+FRAME_COMPRESSED: int = 0x08
+FRAME_ROOM: int = 0x09
+FRAME_BUS_EVENT: int = 0x10
+
+STATUS_OK: int = 0
+STATUS_BAD_REQUEST: int = 1
+STATUS_UNKNOWN_COMMAND: int = 2
+STATUS_DUPLICATED_USERNAME: int = 3
+STATUS_NO_AVAILABLE_ROOM: int = 4
+STATUS_ROOM_REMOVING: int = 5
+STATUS_FORBIDDEN: int = 6
+STATUS_RATE_LIMITED: int = 7
+
+BUS_WELCOME: int = 0x01
+BUS_NODE_LEFT: int = 0x02
+BUS_CREATE_ROOM: int = 0x03
+BUS_SET_STATUS: int = 0x04
+BUS_REMOVE_ROOM: int = 0x05
+BUS_JOIN: int = 0x06
+BUS_LEAVE: int = 0x07
+BUS_BROADCAST: int = 0x08
+BUS_CLAIM_USERNAME: int = 0x09
+BUS_CLAIM_RESULT: int = 0x0A
+BUS_RELEASE_USERNAME: int = 0x0B
+
+ASK_USERNAME_PROMPT: bytes = b"ask_username_prompt"
+EXIT_ROOM: bytes = b"exit_room"
+EXIT_CLI: bytes = b"exit_cli"
+PING: bytes = b"ping"
+PONG: bytes = b"pong"
+
+COMPRESSION_ZLIB: str = "zlib"
+
+class ProtocolError(Exception):
+    pass
+
+class Frame(object):
+    __slots__ = ("type", "payload", "room")
+
+    def __init__(self, type: int, payload: bytes, room: str = "") -> None:
+        self.type = type
+        self.payload = payload
+        self.room = room
+
+    def text(self) -> str:
+        return self.payload.decode(errors="replace")
+
+    def __repr__(self) -> str:
+        if self.room:
+            return f"Frame(type={self.type}, payload={self.payload!r}, room={self.room!r})"
+
+        return f"Frame(type={self.type}, payload={self.payload!r})"
+
+def encode_frame(frame_type: int, payload: bytes = b"") -> bytes:
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"payload of {len(payload)} bytes exceeds {MAX_PAYLOAD_SIZE} bytes")
+
+    return FRAME_HEADER.pack(PROTOCOL_VERSION, frame_type, len(payload)) + payload
+
+def encode_room_frame(room_id: str, frames: bytes) -> bytes:
+    encoded_room_id = room_id.encode()
+    return encode_frame(FRAME_ROOM, ROOM_FRAME_HEADER.pack(len(encoded_room_id)) + encoded_room_id + frames)
+
+def encode_request(correlation_id: int, command: str, argument: str = "") -> bytes:
+    line = f"{command} {argument}" if argument else command
+    return encode_frame(FRAME_REQUEST, REQUEST_HEADER.pack(correlation_id) + line.encode())
+
+def decode_request(payload: bytes) -> tuple[int, str, str]:
+    if len(payload) < REQUEST_HEADER.size:
+        raise ProtocolError("request frame is too short")
+
+    (correlation_id,) = REQUEST_HEADER.unpack_from(payload)
+    command, _, argument = payload[REQUEST_HEADER.size:].decode(errors="replace").strip().partition(" ")
+    return correlation_id, command, argument.strip()
+
+def encode_response(correlation_id: int, status: int, body: bytes = b"") -> bytes:
+    return encode_frame(FRAME_RESPONSE, RESPONSE_HEADER.pack(correlation_id, status) + body)
+
+def decode_response(payload: bytes) -> tuple[int, int, bytes]:
+    if len(payload) < RESPONSE_HEADER.size:
+        raise ProtocolError("response frame is too short")
+
+    correlation_id, status = RESPONSE_HEADER.unpack_from(payload)
+    return correlation_id, status, payload[RESPONSE_HEADER.size:]
+
+def encode_chat(sender: str, text: bytes) -> bytes:
+    encoded_sender = sender.encode()
+    if len(encoded_sender) > 0xFF:
+        raise ProtocolError(f"sender of {len(encoded_sender)} bytes exceeds 255 bytes")
+
+    return CHAT_SENDER_HEADER.pack(len(encoded_sender)) + encoded_sender + text
+
+def decode_chat(payload: bytes) -> tuple[str, bytes]:
+    if len(payload) < CHAT_SENDER_HEADER.size or payload[0] != 0:
+        return "", payload
+
+    (sender_length,) = CHAT_SENDER_HEADER.unpack_from(payload)
+    text_offset = CHAT_SENDER_HEADER.size + sender_length
+    return payload[CHAT_SENDER_HEADER.size:text_offset].decode(errors="replace"), payload[text_offset:]
+
+def encode_bus_event(kind: int, origin: int, room_id: str = "", body: bytes = b"") -> bytes:
+    encoded_room_id = room_id.encode()
+    return encode_frame(FRAME_BUS_EVENT, BUS_EVENT_HEADER.pack(kind, origin, len(encoded_room_id)) + encoded_room_id + body)
+
+def decode_bus_event(payload: bytes) -> tuple[int, int, str, bytes]:
+    if len(payload) < BUS_EVENT_HEADER.size:
+        raise ProtocolError("bus event frame is too short")
+
+    kind, origin, room_id_length = BUS_EVENT_HEADER.unpack_from(payload)
+    body_offset = BUS_EVENT_HEADER.size + room_id_length
+    return kind, origin, payload[BUS_EVENT_HEADER.size:body_offset].decode(), payload[body_offset:]
+
+class FrameDecoder(object):
+    def __init__(self, max_payload_size: int = MAX_PAYLOAD_SIZE, inflate: bool = False) -> None:
+        self.max_payload_size = max_payload_size
+        self.buffer = bytearray()
+        self.inflater = zlib.decompressobj() if inflate else None
+
+
+    def feed(self, data: bytes) -> list[Frame]:
+        self.buffer += data
+
+        frames: list[Frame] = []
+        offset = self.__decode(self.buffer, frames)
+        if offset:
+            del self.buffer[:offset]
+
+        return frames
+
+
+    def __decode(self, buffer, frames: list[Frame], room: str = "") -> int:
+        offset = 0
+        total = len(buffer)
+        while total - offset >= FRAME_HEADER.size:
+            version, frame_type, length = FRAME_HEADER.unpack_from(buffer, offset)
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f"unsupported protocol version {version}")
+
+            if length > self.max_payload_size:
+                raise ProtocolError(f"frame of {length} bytes exceeds {self.max_payload_size} bytes")
+
+            start = offset + FRAME_HEADER.size
+            end = start + length
+            if end > total:
+                break
+
+            payload = bytes(buffer[start:end])
+            if self.inflater is not None and frame_type in (FRAME_DEFLATE, FRAME_COMPRESSED):
+                self.__inflate(frame_type, payload, frames, room)
+            elif frame_type == FRAME_ROOM:
+                self.__unwrap_room(payload, frames, room)
+            else:
+                frames.append(Frame(type=frame_type, payload=payload, room=room))
+
+            offset = end
+
+        return offset
+
+
+    def __inflate(self, frame_type: int, payload: bytes, frames: list[Frame], room: str = "") -> None:
+        if frame_type == FRAME_DEFLATE and self.inflater.eof:
+            self.inflater = zlib.decompressobj()
+
+        inflater = self.inflater if frame_type == FRAME_DEFLATE else zlib.decompressobj()
+        try:
+            inflated = inflater.decompress(payload, MAX_INFLATED_SIZE)
+
+        except zlib.error as e:
+            raise ProtocolError(f"compressed frame is corrupted: {e}") from None
+
+        if inflater.unconsumed_tail:
+            raise ProtocolError(f"compressed frame inflates beyond {MAX_INFLATED_SIZE} bytes")
+
+        if frame_type == FRAME_COMPRESSED and not inflater.eof:
+            raise ProtocolError("compressed frame is truncated")
+
+        if self.__decode(inflated, frames, room) != len(inflated):
+            raise ProtocolError("compressed frame holds a partial frame")
+
+
+    def __unwrap_room(self, payload: bytes, frames: list[Frame], room: str = "") -> None:
+        if room:
+            raise ProtocolError("room frames cannot be nested")
+
+        if len(payload) < ROOM_FRAME_HEADER.size:
+            raise ProtocolError("room frame is too short")
+
+        (room_id_length,) = ROOM_FRAME_HEADER.unpack_from(payload)
+        body_offset = ROOM_FRAME_HEADER.size + room_id_length
+        room_id = payload[ROOM_FRAME_HEADER.size:body_offset].decode(errors="replace")
+        if not room_id:
+            raise ProtocolError("room frame has an empty room id")
+
+        if self.__decode(payload[body_offset:], frames, room_id) != len(payload) - body_offset:
+            raise ProtocolError("room frame holds a partial frame")
+
+class FrameReader(object):
+    def __init__(self, reader: asyncio.StreamReader, chunk_size: int = READ_CHUNK_SIZE, inflate: bool = False) -> None:
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.decoder = FrameDecoder(inflate=inflate)
+        self.frames: deque[Frame] = deque()
+        self.bytes_read = 0
+
+
+    def pending(self) -> int:
+        return len(self.frames)
+
+
+    def feed(self, data: bytes) -> None:
+        self.frames.extend(self.decoder.feed(data))
+
+
+    def unread(self) -> bytes:
+        decoded: list[bytes] = []
+        for frame in self.frames:
+            encoded_frame = encode_frame(frame.type, frame.payload)
+            decoded.append(encode_room_frame(frame.room, encoded_frame) if frame.room else encoded_frame)
+
+        # StreamReader has no public way to take bytes it already buffered without waiting, so its private buffer is read when it has one.
+        return b"".join(decoded) + bytes(self.decoder.buffer) + bytes(getattr(self.reader, "_buffer", b""))
+
+
+    async def read(self) -> Frame | None:
+        while not self.frames:
+            stream_data = await self.reader.read(self.chunk_size)
+            if not stream_data:
+                return None
+
+            self.bytes_read += len(stream_data)
+            self.frames.extend(self.decoder.feed(stream_data))
+
+        return self.frames.popleft()
@@ -1,415 +1,2463 @@
+import os
+import sys
+import json
+import math
+import zlib
+import time
+import array
+import base64
 import signal
+import socket
+import argparse
+import tempfile
+import multiprocessing
 
+import heapq
 import string
 import random
 import asyncio
 
+from abc import ABC, abstractmethod
+from enum import Enum
+from dataclasses import dataclass, field
+from collections import deque
+from collections.abc import Callable, KeysView, ValuesView
 from datetime import datetime
 
-class Participant(object):
+from __protocol__ import (
+    FRAME_CONTROL,
+    FRAME_TEXT,
+    FRAME_CHAT,
+    FRAME_REQUEST,
+    FRAME_ERROR,
+    FRAME_DEFLATE,
+    FRAME_COMPRESSED,
+    FRAME_BUS_EVENT,
+    FRAME_HEADER,
+    MAX_PAYLOAD_SIZE,
+    ROOM_FRAME_HEADER,
+    STATUS_OK,
+    STATUS_FORBIDDEN,
+    STATUS_BAD_REQUEST,
+    STATUS_UNKNOWN_COMMAND,
+    STATUS_DUPLICATED_USERNAME,
+    STATUS_NO_AVAILABLE_ROOM,
+    STATUS_ROOM_REMOVING,
+    STATUS_RATE_LIMITED,
+    BUS_NODE_LEFT,
+    BUS_CREATE_ROOM,
+    BUS_SET_STATUS,
+    BUS_REMOVE_ROOM,
+    BUS_JOIN,
+    BUS_LEAVE,
+    BUS_BROADCAST,
+    ASK_USERNAME_PROMPT,
+    EXIT_ROOM,
+    EXIT_CLI,
+    PING,
+    PONG,
+    COMPRESSION_ZLIB,
+    Frame,
+    FrameDecoder,
+    FrameReader,
+    ProtocolError,
+    decode_bus_event,
+    decode_request,
+    encode_bus_event,
+    encode_chat,
+    encode_frame,
+    encode_room_frame,
+    encode_response
+)
+from __broker__ import Broker, BrokerLink
+from __storage__ import MessageLog
+from __handoff__ import accept_successor, send_handoff, take_over
+from __metrics__ import ChatMetrics, MetricsServer
+from __logging__ import logger, setup_logging
+from __loop__ import LOOP_BACKENDS, run as run_event_loop
+
+LOOPBACK_HOSTS: frozenset[str] = frozenset({"127.0.0.1", "::1"})
+COMPRESSION_WINDOW_BITS: int = 12
+COMPRESSION_MEMORY_LEVEL: int = 5
+ROOM_ID_ALPHABET: str = string.ascii_uppercase + string.digits
+MAX_ROOM_FRAMES_SIZE: int = MAX_PAYLOAD_SIZE - ROOM_FRAME_HEADER.size - 0xFF
+MAX_COUNT_DIGITS: int = 9
+MAX_TITLE_SIZE: int = 0xFF
+
+class SlowConsumerPolicy(Enum):
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+    DISCONNECT = "disconnect"
+        
+    def __str__(self) -> str:
+        return self.value
+    
+DROP_OLDEST_POLICY = SlowConsumerPolicy.DROP_OLDEST
+COALESCE_POLICY = SlowConsumerPolicy.COALESCE
+DISCONNECT_POLICY = SlowConsumerPolicy.DISCONNECT
+
+def approximate_sizeof(*objects: object) -> int:
+    total = 0
+    for obj in objects:
+        total += sys.getsizeof(obj)
+        
+        attributes = getattr(obj, "__dict__", None)
+        if attributes is not None:
+            total += sys.getsizeof(attributes)
+            
+    return total
+
+def parse_count(text: str) -> int | None:
+    # str.isdigit() also accepts digits such as "²" that int() rejects, so only short ASCII numbers are parsed.
+    text = text.strip()
+    if not text.isascii() or not text.isdigit() or len(text) > MAX_COUNT_DIGITS:
+        return None
+    
+    return int(text)
+
+def clip_text(text: str, size: int = MAX_TITLE_SIZE) -> str:
+    # Cuts on a byte budget without splitting a multi-byte character.
+    return text.encode()[:size].decode(errors="ignore")
+
+class Outbox(object):
+    __slots__ = (
+        "writer", "capacity", "policy", "coalesce_limit", "flush_interval", "high_water", "metrics",
+        "queue", "control", "sequence", "ready", "closed", "dropped", "bytes_written", "compressor", "compression_threshold", "task"
+    )
+    
+    def __init__(
+        self,
+        writer: asyncio.StreamWriter,
+        capacity: int,
+        policy: SlowConsumerPolicy,
+        coalesce_limit: int,
+        flush_interval: float = 0.0,
+        high_water: int = 64 << 10,
+        metrics: ChatMetrics | None = None
+    ) -> None:
+        self.writer = writer
+        self.capacity = capacity
+        self.policy = policy
+        self.coalesce_limit = coalesce_limit
+        self.flush_interval = flush_interval
+        self.high_water = high_water
+        self.metrics = metrics
+        
+        writer.transport.set_write_buffer_limits(high=high_water)
+        
+        # Both lanes hold (sequence, frame) pairs so a flush can merge them back into the order they were sent in.
+        self.queue: deque[tuple[int, bytes]] = deque()
+        self.control: deque[tuple[int, bytes]] = deque()
+        self.sequence = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+        self.bytes_written = 0
+        self.compressor = None
+        self.compression_threshold = 0
+        
+        self.task = asyncio.create_task(self.__flush_forever())
+        
+        
+    def send(self, message: bytes) -> bool:
+        if self.closed:
+            return False
+        
+        # Responses and control frames are never shed, a peer that stops reading its own replies is disconnected instead.
+        if len(self.control) >= self.capacity:
+            self.abort()
+            return False
+        
+        self.control.append((self.sequence, message))
+        self.sequence += 1
+        self.ready.set()
+        return True
+    
+    
+    def send_broadcast(self, message: bytes) -> bool:
+        if self.closed:
+            return False
+        
+        if len(self.queue) >= self.capacity:
+            if self.policy is DISCONNECT_POLICY:
+                self.abort()
+                return False
+            
+            if self.policy is COALESCE_POLICY:
+                coalesced = b"".join(frame for _, frame in self.queue)
+                if len(coalesced) + len(message) > self.coalesce_limit:
+                    self.abort()
+                    return False
+                
+                # The merged frame takes the place of the oldest one, so control frames sent in between go out after it rather than ahead of older broadcasts.
+                first_sequence = self.queue[0][0]
+                self.queue.clear()
+                self.queue.append((first_sequence, coalesced))
+            
+            else:
+                self.queue.popleft()
+                self.dropped += 1
+                
+        self.queue.append((self.sequence, message))
+        self.sequence += 1
+        self.ready.set()
+        return True
+    
+    
+    def enable_compression(self, level: int, threshold: int) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, COMPRESSION_WINDOW_BITS, COMPRESSION_MEMORY_LEVEL)
+        self.compression_threshold = threshold
+        
+        
+    def __deflate(self, message: bytes) -> bytes:
+        if len(message) < self.compression_threshold or len(message) > MAX_PAYLOAD_SIZE or message[1] == FRAME_COMPRESSED:
+            return message
+        
+        return encode_frame(FRAME_DEFLATE, self.compressor.compress(message) + self.compressor.flush(zlib.Z_SYNC_FLUSH))
+    
+    
+    def abort(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        self.control.clear()
+        self.task.cancel()
+        self.writer.transport.abort()
+        
+        
+    async def close(self) -> None:
+        self.closed = True
+        self.ready.set()
+        await asyncio.gather(self.task, return_exceptions=True)
+        
+        
+    def reopen(self) -> None:
+        # Undoes detach() for a session that stays in this process after all.
+        self.closed = False
+        self.writer.transport.set_write_buffer_limits(high=self.high_water)
+        self.task = asyncio.create_task(self.__flush_forever())
+        
+        
+    async def detach(self, timeout: float) -> bool:
+        await self.close()
+        
+        transport = self.writer.transport
+        if transport.is_closing():
+            return False
+        
+        if self.compressor is not None:
+            # Finish the deflate stream so the client restarts its inflater on the next process's first compressed frame.
+            self.writer.write(encode_frame(FRAME_DEFLATE, self.compressor.flush(zlib.Z_FINISH)))
+            self.compressor = None
+            
+        transport.set_write_buffer_limits(high=0)
+        try:
+            await asyncio.wait_for(self.writer.drain(), timeout)
+            
+        except (ConnectionError, asyncio.TimeoutError):
+            return False
+        
+        return transport.get_write_buffer_size() == 0 and not transport.is_closing()
+    
+    
+    async def __flush_forever(self) -> None:
+        writer = self.writer
+        transport = writer.transport
+        try:
+            while self.queue or self.control or not self.closed:
+                await self.ready.wait()
+                if self.flush_interval > 0 and not self.closed:
+                    await asyncio.sleep(self.flush_interval)
+                    
+                self.ready.clear()
+                if not self.queue and not self.control:
+                    continue
+                
+                if transport.is_closing():
+                    raise ConnectionResetError("transport is closing")
+                
+                entries = heapq.merge(self.control, self.queue) if self.control and self.queue else self.control or self.queue
+                batch = [message for _, message in entries]
+                self.control, self.queue = deque(), deque()
+                if self.compressor is not None:
+                    batch = [self.__deflate(message) for message in batch]
+                    
+                writer.writelines(batch)
+                self.bytes_written += sum(map(len, batch))
+                if self.metrics is not None:
+                    self.metrics.flush_batch_messages.observe(len(batch))
+                    
+                if transport.get_write_buffer_size() < self.high_water:
+                    continue
+                
+                started = time.perf_counter()
+                await writer.drain()
+                if self.metrics is not None:
+                    self.metrics.drain_stall_seconds.observe(time.perf_counter() - started)
+                    
+        except ConnectionError:
+            self.closed = True
+            self.queue.clear()
+            self.control.clear()
+
+class MessageHistory(object):
+    __slots__ = ("capacity", "byte_budget", "messages", "sizes", "first_sequence", "next_sequence", "total_bytes")
+    
+    def __init__(self, capacity: int = 256, byte_budget: int = 1 << 20) -> None:
+        self.capacity = max(capacity, 1)
+        self.byte_budget = byte_budget
+        
+        self.messages: list[bytes] = [b""] * self.capacity
+        self.sizes = array.array("I", bytes(4 * self.capacity))
+        self.first_sequence = 0
+        self.next_sequence = 0
+        self.total_bytes = 0
+        
+        
+    def __len__(self) -> int:
+        return self.next_sequence - self.first_sequence
+    
+    
+    def __evict_oldest(self) -> None:
+        slot = self.first_sequence % self.capacity
+        self.total_bytes -= self.sizes[slot]
+        self.messages[slot] = b""
+        self.sizes[slot] = 0
+        self.first_sequence += 1
+        
+        
+    def append(self, encoded_message: bytes) -> None:
+        size = len(encoded_message)
+        if size > self.byte_budget:
+            return
+        
+        while len(self) >= self.capacity or (len(self) and self.total_bytes + size > self.byte_budget):
+            self.__evict_oldest()
+            
+        slot = self.next_sequence % self.capacity
+        self.messages[slot] = encoded_message
+        self.sizes[slot] = size
+        self.total_bytes += size
+        self.next_sequence += 1
+        
+        
+    def read(self, start: int, stop: int) -> bytes:
+        start = max(start, self.first_sequence)
+        stop = min(stop, self.next_sequence)
+        if start >= stop:
+            return b""
+        
+        first_slot = start % self.capacity
+        last_slot = first_slot + (stop - start)
+        if last_slot <= self.capacity:
+            return b"".join(self.messages[first_slot:last_slot])
+        
+        return b"".join(self.messages[first_slot:]) + b"".join(self.messages[:last_slot - self.capacity])
+    
+    
+    def get_memory_usage(self) -> int:
+        return approximate_sizeof(self, self.messages, self.sizes) + self.total_bytes
+    
+class TimerWheel(object):
+    __slots__ = ("tick", "wheel", "position", "locations")
+    
+    def __init__(self, tick: float = 1.0, slots: int = 512) -> None:
+        self.tick = tick
+        self.wheel: list[dict[object, int]] = [{} for _ in range(slots)]
+        self.position = 0
+        self.locations: dict[object, int] = {}
+        
+        
+    def __len__(self) -> int:
+        return len(self.locations)
+    
+    
+    def schedule(self, item: object, delay: float) -> None:
+        self.cancel(item)
+        
+        # Slots are checked after the position advances, so a delay of exactly n laps lands on the current slot.
+        rounds, offset = divmod(max(math.ceil(delay / self.tick), 1) - 1, len(self.wheel))
+        slot = (self.position + offset + 1) % len(self.wheel)
+        self.wheel[slot][item] = rounds
+        self.locations[item] = slot
+        
+        
+    def cancel(self, item: object) -> None:
+        slot = self.locations.pop(item, None)
+        if slot is not None:
+            del self.wheel[slot][item]
+            
+            
+    def advance(self) -> list[object]:
+        self.position = (self.position + 1) % len(self.wheel)
+        bucket = self.wheel[self.position]
+        
+        expired: list[object] = []
+        for item, rounds in bucket.items():
+            if rounds:
+                bucket[item] = rounds - 1
+            else:
+                expired.append(item)
+                
+        for item in expired:
+            del bucket[item]
+            del self.locations[item]
+            
+        return expired
+    
+class TokenBucket(object):
+    __slots__ = ("rate", "burst", "tokens", "updated")
+    
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        
+        
+    def consume(self, now: float, cost: float = 1.0) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < cost:
+            return False
+        
+        self.tokens -= cost
+        return True
+    
+    
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+    
+@dataclass(slots=True, frozen=True)
+class RateLimits:
+    message_rate: float = 10.0
+    message_burst: int = 20
+    ip_message_rate: float = 100.0
+    ip_message_burst: int = 200
+    room_message_rate: float = 500.0
+    room_message_burst: int = 1000
+    ip_connect_rate: float = 20.0
+    ip_connect_burst: int = 50
+    flood_tolerance: int = 100
+    max_in_flight_broadcasts: int = 10_000
+    
+    
+    @classmethod
+    def unlimited(cls) -> "RateLimits":
+        return cls(
+            message_rate=0,
+            ip_message_rate=0,
+            room_message_rate=0,
+            ip_connect_rate=0,
+            flood_tolerance=0,
+            max_in_flight_broadcasts=0
+        )
+    
+    
+    @staticmethod
+    def create_bucket(rate: float, burst: float, now: float) -> TokenBucket | None:
+        return TokenBucket(rate=rate, burst=max(burst, 1), now=now) if rate > 0 else None
+    
+class AddressLimits(object):
+    __slots__ = ("connections", "connects", "messages")
+    
+    def __init__(self, limits: RateLimits, now: float) -> None:
+        self.connections = 0
+        self.connects = limits.create_bucket(rate=limits.ip_connect_rate, burst=limits.ip_connect_burst, now=now)
+        self.messages = limits.create_bucket(rate=limits.ip_message_rate, burst=limits.ip_message_burst, now=now)
+        
+        
+    def is_idle(self, now: float) -> bool:
+        return self.connections < 1 and (self.connects is None or self.connects.is_full(now))
+    
+@dataclass(slots=True, eq=False)
+class Participant:
+    username: str
+    address: tuple
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    outbox: Outbox
+    frames: FrameReader
+    last_seen: float = 0.0
+    room_id: str = ""
+    rooms: set[str] = field(default_factory=set)
+    history_cursors: dict[str, int] = field(default_factory=dict)
+    limiter: TokenBucket | None = None
+    strikes: TokenBucket | None = None
+    address_limits: AddressLimits | None = None
+    throttled: bool = False
+    messages_accepted: int = 0
+    messages_throttled: int = 0
+    frames_since_yield: int = 0
+    multiplexed: bool = False
+    detached: bool = False
+    task: asyncio.Task | None = None
+    
+    
+    def send_room_frames(self, room_id: str, frames: bytes, broadcast: bool = False) -> bool:
+        send = self.outbox.send_broadcast if broadcast else self.outbox.send
+        if self.multiplexed and len(frames) <= MAX_ROOM_FRAMES_SIZE:
+            return send(encode_room_frame(room_id, frames))
+        
+        return send(frames)
+    
+    
+    def get_memory_usage(self) -> int:
+        transport = self.writer.transport
+        return (
+            approximate_sizeof(self, self.username, self.address, self.rooms, self.history_cursors, *self.address)
+            + sum(sys.getsizeof(room_id) for room_id in self.rooms)
+            + approximate_sizeof(self.outbox, self.outbox.queue, self.outbox.control, self.outbox.ready, self.outbox.task)
+            + sum(sys.getsizeof(entry) + sys.getsizeof(entry[1]) for entry in self.outbox.queue)
+            + sum(sys.getsizeof(entry) + sys.getsizeof(entry[1]) for entry in self.outbox.control)
+            # StreamReader keeps unread bytes in a private buffer, counted here only when it has one.
+            + approximate_sizeof(self.reader, getattr(self.reader, "_buffer", b""), self.writer, transport, transport.get_protocol())
+        )
+        
+class RoomStatus(Enum):
+    OPENED = "opened"
+    REMOVING = "removing"
+        
+    def __str__(self) -> str:
+        return self.value
+    
+ROOM_OPENED_STATUS = RoomStatus.OPENED
+ROOM_REMOVING_STATUS = RoomStatus.REMOVING
+
+@dataclass(slots=True, eq=False)
+class RoomMetadata:
+    id: str
+    title: str
+    status: RoomStatus = ROOM_OPENED_STATUS
+    participants: dict[str, Participant] = field(default_factory=dict)
+    remote_participants: dict[str, int] = field(default_factory=dict)
+    history: MessageHistory = field(default_factory=MessageHistory)
+    limiter: TokenBucket | None = None
+    
+    
+    def get_memory_usage(self) -> int:
+        return approximate_sizeof(self, self.id, self.title, self.participants, self.remote_participants) + self.history.get_memory_usage()
+        
+        
+    def get_total_of_participants(self) -> int:
+        return len(self.participants) + len(self.remote_participants)
+    
+    
+    def get_all_participants(self) -> ValuesView[Participant]:
+        return self.participants.values()
+    
+    
+    def get_all_username_participants(self) -> KeysView[str]:
+        return self.participants.keys()
+    
+    
+    def exists_username_participant(self, username: str) -> bool:
+        return username in self.participants or username in self.remote_participants
+    
+        
+    def add_participant(self, pariticpant: Participant) -> None:
+        self.participants[pariticpant.username] = pariticpant
+    
+        
+    def remove_participant(self, username: str) -> Participant | None:
+        return self.participants.pop(username, None)
+          
+class RoomDirectory(object):
+    __rooms_per_page__: int = 50
+    __cached_searches__: int = 128
+    
+    def __init__(self) -> None:
+        self.rooms: dict[str, RoomMetadata] = {}
+        self.lines: dict[str, bytes] = {}
+        self.search_keys: dict[str, str] = {}
+        self.dirty: set[str] = set()
+        
+        self.ordered_ids: list[str] | None = None
+        self.ordered_lines: list[bytes] = []
+        self.positions: dict[str, int] = {}
+        
+        self.pages: dict[int, bytes] = {}
+        self.searches: dict[str, bytes] = {}
+        
+        
+    def __invalidate(self) -> None:
+        # Rendered pages and searches are dropped on every change, so each is rendered once until the next one.
+        self.pages.clear()
+        self.searches.clear()
+        
+        
+    def update(self, metadata: RoomMetadata) -> None:
+        if metadata.id not in self.rooms:
+            self.rooms[metadata.id] = metadata
+            self.search_keys[metadata.id] = f"{metadata.id} {metadata.title}".casefold()
+            self.ordered_ids = None
+            
+        self.dirty.add(metadata.id)
+        self.__invalidate()
+        
+        
+    def discard(self, room_id: str) -> None:
+        if self.rooms.pop(room_id, None) is None:
+            return
+        
+        self.lines.pop(room_id, None)
+        self.search_keys.pop(room_id, None)
+        self.dirty.discard(room_id)
+        self.ordered_ids = None
+        self.__invalidate()
+        
+        
+    def __refresh(self) -> None:
+        for room_id in self.dirty:
+            metadata = self.rooms[room_id]
+            # Titles recovered from older logs may predate the size limit, so a page of lines stays bounded either way.
+            self.lines[room_id] = f"\t→ [ID: {room_id}] {clip_text(metadata.title)} ({metadata.get_total_of_participants()} participants)\n".encode()
+            
+            if self.ordered_ids is not None:
+                self.ordered_lines[self.positions[room_id]] = self.lines[room_id]
+                
+        self.dirty.clear()
+        
+        if self.ordered_ids is None:
+            self.ordered_ids = list(self.lines)
+            self.ordered_lines = list(self.lines.values())
+            self.positions = {room_id: position for position, room_id in enumerate(self.ordered_ids)}
+            
+            
+    def get_total_of_pages(self) -> int:
+        return max((len(self.rooms) + self.__rooms_per_page__ - 1) // self.__rooms_per_page__, 1)
+        
+        
+    def render_page(self, page: int = 1) -> bytes:
+        rendered_page = self.pages.get(page)
+        if rendered_page is not None:
+            return rendered_page
+        
+        self.__refresh()
+        
+        total_of_rooms: int = len(self.ordered_lines)
+        total_of_pages: int = self.get_total_of_pages()
+        start: int = (page - 1) * self.__rooms_per_page__
+        
+        header = f"\n\tAll rooms available ({total_of_rooms} rooms, page {page} of {total_of_pages})\n".encode()
+        if total_of_rooms < 1:
+            rendered_page = header + "\t🚫 There are no rooms available.\n".encode()
+        elif page < 1 or start >= total_of_rooms:
+            rendered_page = header + f"\t🚫 There is no page {page}.\n".encode()
+        else:
+            rendered_page = header + b"".join(self.ordered_lines[start:start + self.__rooms_per_page__])
+        
+        # Only real pages are cached, so the cache stays bounded by the number of rooms.
+        if 1 <= page <= total_of_pages:
+            self.pages[page] = rendered_page
+            
+        return rendered_page
+    
+    
+    def render_search(self, text: str) -> bytes:
+        needle: str = text.casefold()
+        rendered_search = self.searches.get(needle)
+        if rendered_search is not None:
+            return rendered_search
+        
+        self.__refresh()
+        
+        matches: list[str] = [room_id for room_id, search_key in self.search_keys.items() if needle in search_key]
+        shown: list[str] = matches[:self.__rooms_per_page__]
+        
+        rendered_search = f"\n\tRooms matching `{clip_text(text)}` ({len(matches)} rooms)\n".encode()
+        if not matches:
+            rendered_search += "\t🚫 There are no rooms matching the filter.\n".encode()
+        else:
+            rendered_search += b"".join(self.lines[room_id] for room_id in shown)
+            
+        if len(matches) > len(shown):
+            rendered_search += f"\t… and {len(matches) - len(shown)} more, narrow the filter to see them.\n".encode()
+            
+        if len(self.searches) >= self.__cached_searches__:
+            self.searches.clear()
+            
+        self.searches[needle] = rendered_search
+        return rendered_search
+    
+class RoomStore(ABC):
+    directory: RoomDirectory
+    
+    @abstractmethod
+    def exists_room(self, room_id: str) -> bool:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def get_room(self, room_id: str) -> RoomMetadata | None:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def get_total_of_rooms(self) -> int:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def get_all_room(self) -> dict[str, RoomMetadata]:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def create_room(self, room_id: str, title: str) -> RoomMetadata:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def set_status_room(self, room_id: str, status: RoomStatus) -> None:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def remove_room(self, room_id: str) -> RoomMetadata:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def add_participant_to_room(self, room_id: str, participant: Participant) -> None:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def remove_participant_from_room(self, room_id: str, username: str) -> Participant | None:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def join_room(self, room_id: str, participant: Participant) -> int:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def leave_room(self, room_id: str, username: str) -> Participant | None:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def close_room(self, room_id: str) -> int:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def append_message(self, room_id: str, message: bytes) -> bytes | None:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def apply(self, kind: int, origin: int, room_id: str, body: bytes) -> None:
+        raise NotImplementedError
+    
+    
+    def reopen(self) -> None:
+        return
+    
+    
+    async def close(self) -> None:
+        return
+    
+class InMemoryRoomStore(RoomStore):
+    def __init__(self, history_capacity: int = 256, history_byte_budget: int = 1 << 20) -> None:
+        self.rooms: dict[str, RoomMetadata] = {}
+        self.directory = RoomDirectory()
+        self.history_capacity = history_capacity
+        self.history_byte_budget = history_byte_budget
+        
+
+    def exists_room(self, room_id: str) -> bool:
+        return room_id in self.rooms
+    
+    
+    def get_room(self, room_id: str) -> RoomMetadata | None:
+        return self.rooms.get(room_id)
+    
+    
+    def get_total_of_rooms(self) -> int:
+        return len(self.rooms)
+    
+    
+    def get_all_room(self) -> dict[str, RoomMetadata]:
+        return self.rooms
+    
+    
+    def create_room(self, room_id: str, title: str) -> RoomMetadata:
+        room_id = sys.intern(room_id)
+        metadata = RoomMetadata(
+            id=room_id,
+            title=title,
+            history=MessageHistory(capacity=self.history_capacity, byte_budget=self.history_byte_budget)
+        )
+        self.rooms[room_id] = metadata
+        self.directory.update(metadata)
+        return metadata
+    
+    
+    def set_status_room(self, room_id: str, status: RoomStatus) -> None:
+        self.rooms[room_id].status = status
+        self.directory.update(self.rooms[room_id])
+    
+    
+    def remove_room(self, room_id: str) -> RoomMetadata:
+        metadata = self.rooms.pop(room_id)
+        self.directory.discard(room_id)
+        for pc in metadata.get_all_participants():
+            pc.rooms.discard(room_id)
+            pc.history_cursors.pop(room_id, None)
+            if pc.room_id == room_id or pc.multiplexed:
+                pc.send_room_frames(room_id, encode_frame(FRAME_ERROR, b"This room has been removed, use /exit to go back."))
+                
+            if pc.room_id == room_id:
+                pc.room_id = next(iter(pc.rooms), "")
+            
+        return metadata
+    
+    
+    def add_participant_to_room(self, room_id: str, participant: Participant) -> None:
+        self.rooms[room_id].add_participant(pariticpant=participant)
+        self.directory.update(self.rooms[room_id])
+        participant.rooms.add(room_id)
+    
+    
+    def remove_participant_from_room(self, room_id: str, username: str) -> Participant | None:
+        participant = self.rooms[room_id].remove_participant(username=username)
+        if participant is not None:
+            self.directory.update(self.rooms[room_id])
+            participant.rooms.discard(room_id)
+            participant.history_cursors.pop(room_id, None)
+            
+        return participant
+    
+    
+    def join_room(self, room_id: str, participant: Participant) -> int:
+        metadata = self.rooms.get(room_id)
+        if metadata is None:
+            return STATUS_NO_AVAILABLE_ROOM
+        
+        if metadata.status is ROOM_REMOVING_STATUS:
+            return STATUS_ROOM_REMOVING
+        
+        self.add_participant_to_room(room_id=room_id, participant=participant)
+        participant.room_id = metadata.id
+        return STATUS_OK
+    
+    
+    def leave_room(self, room_id: str, username: str) -> Participant | None:
+        metadata = self.rooms.get(room_id)
+        if metadata is None:
+            return None
+        
+        participant = self.remove_participant_from_room(room_id=room_id, username=username)
+        if participant is not None and participant.room_id == room_id:
+            participant.room_id = next(iter(participant.rooms), "")
+            
+        if metadata.status is ROOM_REMOVING_STATUS and metadata.get_total_of_participants() < 1:
+            self.remove_room(room_id=room_id)
+            
+        return participant
+    
+    
+    def close_room(self, room_id: str) -> int:
+        metadata = self.rooms.get(room_id)
+        if metadata is None:
+            return STATUS_NO_AVAILABLE_ROOM
+        
+        if metadata.status is not ROOM_REMOVING_STATUS:
+            self.set_status_room(room_id=room_id, status=ROOM_REMOVING_STATUS)
+            
+        if metadata.get_total_of_participants() < 1:
+            self.remove_room(room_id=room_id)
+            
+        return STATUS_OK
+    
+    
+    def append_message(self, room_id: str, message: bytes) -> bytes | None:
+        metadata = self.rooms.get(room_id)
+        if metadata is None:
+            return None
+        
+        encoded_message = encode_frame(FRAME_CHAT, message)
+        metadata.history.append(encoded_message)
+        return encoded_message
+    
+    
+    def apply(self, kind: int, origin: int, room_id: str, body: bytes) -> None:
+        metadata = self.rooms.get(room_id)
+        
+        if kind == BUS_CREATE_ROOM and metadata is None:
+            InMemoryRoomStore.create_room(self, room_id=room_id, title=body.decode())
+            
+        elif kind == BUS_SET_STATUS and metadata is not None:
+            metadata.status = RoomStatus(body.decode())
+            self.directory.update(metadata)
+            
+        elif kind == BUS_REMOVE_ROOM and metadata is not None:
+            InMemoryRoomStore.remove_room(self, room_id=room_id)
+            
+        elif kind == BUS_BROADCAST and metadata is not None:
+            InMemoryRoomStore.append_message(self, room_id=room_id, message=body)
+            
+        return
+    
+class DurableRoomStore(InMemoryRoomStore):
+    def __init__(self, log: MessageLog, history_capacity: int = 256, history_byte_budget: int = 1 << 20) -> None:
+        super().__init__(history_capacity=history_capacity, history_byte_budget=history_byte_budget)
+        self.log = log
+        
+        
+    def recover(self) -> None:
+        recovered_rooms = self.log.recover(history_capacity=self.history_capacity)
+        for room_id, recovered in recovered_rooms.items():
+            metadata = super().create_room(room_id=room_id, title=recovered.title)
+            metadata.status = RoomStatus(recovered.status)
+            for message in recovered.messages:
+                metadata.history.append(encode_frame(FRAME_CHAT, message))
+                
+        self.log.start()
+        
+        for room_id in [room_id for room_id, metadata in self.rooms.items() if metadata.status is ROOM_REMOVING_STATUS]:
+            self.remove_room(room_id=room_id)
+            
+        logger.info("recovered rooms", extra={"rooms": len(self.rooms), "directory": self.log.directory})
+        
+        
+    def create_room(self, room_id: str, title: str) -> RoomMetadata:
+        metadata = super().create_room(room_id=room_id, title=title)
+        self.log.append(BUS_CREATE_ROOM, room_id, title.encode())
+        return metadata
+    
+    
+    def set_status_room(self, room_id: str, status: RoomStatus) -> None:
+        super().set_status_room(room_id=room_id, status=status)
+        self.log.append(BUS_SET_STATUS, room_id, status.value.encode())
+    
+    
+    def remove_room(self, room_id: str) -> RoomMetadata:
+        metadata = super().remove_room(room_id=room_id)
+        self.log.append(BUS_REMOVE_ROOM, room_id)
+        self.log.compact(live_room_ids=self.rooms.keys())
+        return metadata
+    
+    
+    def append_message(self, room_id: str, message: bytes) -> bytes | None:
+        encoded_message = super().append_message(room_id=room_id, message=message)
+        if encoded_message is not None:
+            self.log.append(BUS_BROADCAST, room_id, message)
+            
+        return encoded_message
+    
+    
+    def reopen(self) -> None:
+        self.log.reopen()
+        
+        
+    async def close(self) -> None:
+        await self.log.close()
+    
+class BrokerRoomStore(InMemoryRoomStore):
+    def __init__(self, link: BrokerLink, history_capacity: int = 256, history_byte_budget: int = 1 << 20) -> None:
+        super().__init__(history_capacity=history_capacity, history_byte_budget=history_byte_budget)
+        self.link = link
+        
+    
+    def create_room(self, room_id: str, title: str) -> RoomMetadata:
+        metadata = super().create_room(room_id=room_id, title=title)
+        self.link.publish(BUS_CREATE_ROOM, room_id, title.encode())
+        return metadata
+    
+    
+    def set_status_room(self, room_id: str, status: RoomStatus) -> None:
+        super().set_status_room(room_id=room_id, status=status)
+        self.link.publish(BUS_SET_STATUS, room_id, status.value.encode())
+    
+    
+    def remove_room(self, room_id: str) -> RoomMetadata:
+        metadata = super().remove_room(room_id=room_id)
+        self.link.publish(BUS_REMOVE_ROOM, room_id)
+        return metadata
+    
+    
+    def add_participant_to_room(self, room_id: str, participant: Participant) -> None:
+        super().add_participant_to_room(room_id=room_id, participant=participant)
+        self.link.publish(BUS_JOIN, room_id, participant.username.encode())
+    
+    
+    def remove_participant_from_room(self, room_id: str, username: str) -> Participant | None:
+        participant = super().remove_participant_from_room(room_id=room_id, username=username)
+        self.link.publish(BUS_LEAVE, room_id, username.encode())
+        return participant
+    
+    
+    def apply(self, kind: int, origin: int, room_id: str, body: bytes) -> None:
+        metadata = self.rooms.get(room_id)
+        
+        if kind == BUS_JOIN and metadata is not None:
+            metadata.remote_participants[sys.intern(body.decode())] = origin
+            self.directory.update(metadata)
+            
+        elif kind == BUS_LEAVE and metadata is not None:
+            if metadata.remote_participants.pop(body.decode(), None) is not None:
+                self.directory.update(metadata)
+                self.__remove_if_abandoned(metadata)
+            
+        elif kind == BUS_NODE_LEFT:
+            for metadata in list(self.rooms.values()):
+                for username, node_id in list(metadata.remote_participants.items()):
+                    if node_id == origin:
+                        del metadata.remote_participants[username]
+                        self.directory.update(metadata)
+                        
+                self.__remove_if_abandoned(metadata)
+                        
+        else:
+            super().apply(kind=kind, origin=origin, room_id=room_id, body=body)
+            
+        return
+    
+    
+    def __remove_if_abandoned(self, metadata: RoomMetadata) -> None:
+        # The last members of a closing room may leave on different nodes at once, or vanish with a crashed node, so every node re-checks.
+        if metadata.status is ROOM_REMOVING_STATUS and metadata.get_total_of_participants() < 1:
+            self.remove_room(room_id=metadata.id)
+    
+class PresenceStore(ABC):
+    @abstractmethod
+    def exists_session(self, username: str) -> bool:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def get_session(self, username: str) -> Participant | None:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def get_all_sessions(self) -> ValuesView[Participant]:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    async def claim_username(self, username: str, participant: Participant) -> bool:
+        raise NotImplementedError
+    
+    
+    @abstractmethod
+    def release_username(self, username: str, participant: Participant) -> None:
+        raise NotImplementedError
+    
+class InMemoryPresenceStore(PresenceStore):
+    def __init__(self) -> None:
+        self.sessions: dict[str, Participant] = {}
+        
+        
+    def exists_session(self, username: str) -> bool:
+        return username in self.sessions
+    
+    
+    def get_session(self, username: str) -> Participant | None:
+        return self.sessions.get(username)
+    
+    
+    def get_all_sessions(self) -> ValuesView[Participant]:
+        return self.sessions.values()
+    
+    
+    async def claim_username(self, username: str, participant: Participant) -> bool:
+        if username in self.sessions:
+            return False
+        
+        self.sessions[username] = participant
+        return True
+    
+    
+    def release_username(self, username: str, participant: Participant) -> None:
+        if self.sessions.get(username) is participant:
+            del self.sessions[username]
+    
+class BrokerPresenceStore(InMemoryPresenceStore):
+    def __init__(self, link: BrokerLink) -> None:
+        super().__init__()
+        self.link = link
+        
+        
+    async def claim_username(self, username: str, participant: Participant) -> bool:
+        if username in self.sessions:
+            return False
+        
+        self.sessions[username] = participant
+        if not await self.link.claim_username(username=username):
+            del self.sessions[username]
+            return False
+        
+        return True
+    
+    
+    def release_username(self, username: str, participant: Participant) -> None:
+        if self.sessions.get(username) is participant:
+            del self.sessions[username]
+            self.link.release_username(username=username)
+          
+class RoomIdAllocator(object):
+    __multiplier__: int = 0x5DEECE66D
+    
+    def __init__(self, length: int = 6) -> None:
+        self.__resize(length=length)
+        
+        
+    def __resize(self, length: int) -> None:
+        self.length = length
+        self.capacity = len(ROOM_ID_ALPHABET) ** length
+        # Any multiplier coprime with 2 and 3 makes the affine map a permutation of [0, 36^n), so no sequence number repeats an ID.
+        self.multiplier = self.__multiplier__ % self.capacity
+        self.offset = random.SystemRandom().randrange(self.capacity)
+        self.sequence = 0
+        
+        
+    def __encode(self, value: int) -> str:
+        characters: list[str] = []
+        for _ in range(self.length):
+            value, digit = divmod(value, len(ROOM_ID_ALPHABET))
+            characters.append(ROOM_ID_ALPHABET[digit])
+            
+        return "".join(characters)
+    
+    
+    def allocate(self, exists) -> str:
+        while True:
+            if self.sequence >= self.capacity:
+                logger.info("room ids exhausted, lengthening them", extra={"length": self.length + 1})
+                self.__resize(length=self.length + 1)
+                
+            room_id = self.__encode((self.sequence * self.multiplier + self.offset) % self.capacity)
+            self.sequence += 1
+            if not exists(room_id):
+                return room_id
+    
+class Room:
+    __length_of_room_id__: int = 6
+    
+    def __init__(self, store: RoomStore | None = None) -> None:
+        self.store: RoomStore = store if store is not None else InMemoryRoomStore()
+        self.room_ids = RoomIdAllocator(length=self.__length_of_room_id__)
+    
+
+    def exists_room(self, id) -> bool:
+        return self.store.exists_room(id)
+    
+    
+    def get_room(self, id) -> RoomMetadata | None:
+        return self.store.get_room(id)
+    
+    
+    def get_total_of_rooms(self) -> int:
+        return self.store.get_total_of_rooms()
+    
+    
+    def get_all_room(self) -> dict[str, RoomMetadata]:
+        return self.store.get_all_room()
+    
+    
+    def add_participant_to_room(self, room_id: str, participant: Participant) -> None:
+        self.store.add_participant_to_room(room_id=room_id, participant=participant)
+    
+    
+    def remove_participant_from_room(self, room_id: str, username: str) -> None:
+        self.store.remove_participant_from_room(room_id=room_id, username=username)
+    
+    
+    def join_room(self, room_id: str, participant: Participant) -> int:
+        return self.store.join_room(room_id=room_id, participant=participant)
+    
+    
+    def leave_room(self, room_id: str, username: str) -> Participant | None:
+        return self.store.leave_room(room_id=room_id, username=username)
+    
+    
+    def close_room(self, room_id: str) -> int:
+        return self.store.close_room(room_id=room_id)
+    
+    
+    def get_all_username_participants(self, room_id: str) -> KeysView[str]:
+        return self.store.get_room(room_id).get_all_username_participants()
+            
+    
+    def get_total_of_participants(self, room_id: str) -> int:
+        return self.store.get_room(room_id).get_total_of_participants()
+    
+    
+    def create_room(self, title: str) -> str:
+        room_id = self.room_ids.allocate(exists=self.store.exists_room)
+        return self.store.create_room(room_id=room_id, title=title).id
+    
+    
+    def set_status_room(self, room_id: str, status: RoomStatus) -> None:
+        self.store.set_status_room(room_id=room_id, status=status)
+        return
+    
+    
+    def remove_room(self, room_id: str) -> None:        
+        self.store.remove_room(room_id=room_id)
+        return
+    
+    
+    def get_room_status(self, room_id: str) -> RoomStatus:
+        return self.store.get_room(room_id).status
+
+class Chat(Room):
+    __capacity_plan_sessions__: int = 250_000
+    __address_sweep_ticks__: int = 60
+    __frames_per_yield__: int = 64
+    __unmetered_commands__: frozenset[str] = frozenset({"/sync"})
+    __max_rooms_per_session__: int = 1000
+    
     def __init__(
         self,
-        username: str,
-        address: tuple,
-        reader: asyncio.StreamReader,
-        writer: asyncio.StreamWriter
+        outbox_capacity: int = 256,
+        slow_consumer_policy: SlowConsumerPolicy = DROP_OLDEST_POLICY,
+        outbox_coalesce_limit: int = 1 << 20,
+        outbox_flush_interval: float = 0.0,
+        outbox_high_water: int = 64 << 10,
+        history_capacity: int = 256,
+        history_byte_budget: int = 1 << 20,
+        history_replay: int = 20,
+        heartbeat_interval: float = 30.0,
+        idle_timeout: float = 90.0,
+        rate_limits: RateLimits | None = None,
+        compression_level: int | None = 6,
+        compression_threshold: int = 256,
+        room_store: RoomStore | None = None,
+        presence_store: PresenceStore | None = None
     ) -> None:
-        self.username = username
-        self.address = address
+        if room_store is None:
+            room_store = InMemoryRoomStore(history_capacity=history_capacity, history_byte_budget=history_byte_budget)
+            
+        super().__init__(store=room_store)
         
-        self.reader = reader
-        self.writer = writer
+        self.history_capacity = history_capacity
+        self.history_byte_budget = history_byte_budget
+        self.history_replay = history_replay
+        
+        self.presence: PresenceStore = presence_store if presence_store is not None else InMemoryPresenceStore()
+        self.broker: BrokerLink | None = None
+        self.metrics = ChatMetrics()
+        self.outbox_capacity = outbox_capacity
+        self.slow_consumer_policy = slow_consumer_policy
+        self.outbox_coalesce_limit = outbox_coalesce_limit
+        self.outbox_flush_interval = outbox_flush_interval
+        self.outbox_high_water = outbox_high_water
+        
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.keepalive = TimerWheel(tick=1.0, slots=max(math.ceil(idle_timeout) + 1, 64))
+        
+        self.rate_limits: RateLimits = rate_limits if rate_limits is not None else RateLimits()
+        self.addresses: dict[str, AddressLimits] = {}
+        self.connections: set[Participant] = set()
+        
+        self.compression_level = compression_level
+        self.compression_threshold = compression_threshold
+        
+        self.lobby_commands: dict[str, Callable[[Participant, int, str], None]] = {
+            "/list": self.__list_command,
+            "/connect": self.__connect_command,
+            "/join": self.__join_command,
+            "/sync": self.__sync_command,
+            "/stats": self.__stats_command,
+            "/create": self.__create_command,
+            "/remove": self.__remove_command,
+        }
+        self.room_commands: dict[str, Callable[[Participant, int, str], None]] = {
+            "/join": self.__join_command,
+            "/leave": self.__leave_command,
+            "/switch": self.__switch_command,
+            "/sync": self.__sync_command,
+            "/history": self.__history_command,
+        }
+        
+        
+    def exists_session(self, username: str) -> bool:
+        return self.presence.exists_session(username)
+    
+    
+    def get_session(self, username: str) -> Participant | None:
+        return self.presence.get_session(username)
+    
+    
+    async def __next_frame(self, participant: Participant) -> Frame | None:
+        while True:
+            participant.frames_since_yield += 1
+            if participant.frames_since_yield >= self.__frames_per_yield__:
+                participant.frames_since_yield = 0
+                await asyncio.sleep(0)
+                
+            frame: Frame | None = await participant.frames.read()
+            if frame is None:
+                return None
+            
+            participant.last_seen = time.monotonic()
+            if frame.type == FRAME_CONTROL and frame.payload == PING:
+                participant.outbox.send(encode_frame(FRAME_CONTROL, PONG))
+                continue
+            
+            if frame.type == FRAME_CONTROL and frame.payload == PONG:
+                continue
+            
+            return frame
+        
+        
+    def __check_idle(self, participant: Participant, now: float) -> None:
+        idle: float = now - participant.last_seen
+        if idle >= self.idle_timeout:
+            logger.info("reaping idle connection", extra={"username": participant.username, "address": participant.address, "idle_seconds": round(idle, 1)})
+            self.metrics.idle_reaped.inc()
+            participant.outbox.abort()
+            return
+        
+        if idle >= self.heartbeat_interval:
+            participant.outbox.send(encode_frame(FRAME_CONTROL, PING))
+            self.keepalive.schedule(participant, participant.last_seen + self.idle_timeout - now)
+            return
+        
+        self.keepalive.schedule(participant, participant.last_seen + self.heartbeat_interval - now)
+        
+        
+    async def reap_idle_forever(self) -> None:
+        ticks: int = 0
+        while True:
+            await asyncio.sleep(self.keepalive.tick)
+            
+            now: float = time.monotonic()
+            for participant in self.keepalive.advance():
+                self.__check_idle(participant=participant, now=now)
+                
+            ticks += 1
+            if ticks % self.__address_sweep_ticks__ == 0:
+                self.__sweep_addresses(now=now)
+                
+                
+    def __sweep_addresses(self, now: float) -> None:
+        for host in [host for host, address_limits in self.addresses.items() if address_limits.is_idle(now)]:
+            del self.addresses[host]
+            
+            
+    def __admit_connection(self, participant: Participant) -> bool:
+        now: float = participant.last_seen
+        host: str = participant.address[0] if participant.address else ""
+        
+        address_limits: AddressLimits | None = self.addresses.get(host)
+        if address_limits is None:
+            address_limits = self.addresses[host] = AddressLimits(limits=self.rate_limits, now=now)
+            
+        address_limits.connections += 1
+        participant.address_limits = address_limits
+        participant.limiter = self.rate_limits.create_bucket(rate=self.rate_limits.message_rate, burst=self.rate_limits.message_burst, now=now)
+        if self.rate_limits.flood_tolerance > 0:
+            participant.strikes = TokenBucket(rate=1.0, burst=self.rate_limits.flood_tolerance, now=now)
+            
+        if address_limits.connects is not None and not address_limits.connects.consume(now):
+            self.metrics.rate_limited.inc(labels=("connect",))
+            return False
+        
+        return True
+    
+    
+    def __release_address(self, participant: Participant) -> None:
+        address_limits: AddressLimits | None = participant.address_limits
+        if address_limits is None:
+            return
+        
+        address_limits.connections -= 1
+        host: str = participant.address[0] if participant.address else ""
+        if address_limits.is_idle(time.monotonic()) and self.addresses.get(host) is address_limits:
+            del self.addresses[host]
+            
+            
+    def __throttle(self, participant: Participant, scope: str, notice: bytes, strike: bool = True) -> bytes:
+        self.metrics.rate_limited.inc(labels=(scope,))
+        if strike and participant.strikes is not None and not participant.strikes.consume(participant.last_seen):
+            logger.warning("disconnecting a flooding client", extra={"username": participant.username, "address": participant.address, "scope": scope})
+            self.metrics.flood_disconnects.inc()
+            participant.outbox.send(encode_frame(FRAME_ERROR, b"Disconnected for flooding the server."))
+            raise ProtocolError(f"client kept exceeding the {scope} rate limit")
+        
+        return notice
+    
+    
+    def __admit_request(self, participant: Participant, command: str = "") -> bytes | None:
+        # Acknowledgements skip the connection limit so a throttled client can still learn how much got through,
+        # but they are charged to its address and count as strikes like any other request.
+        now: float = participant.last_seen
+        metered: bool = command not in self.__unmetered_commands__
+        if metered and participant.limiter is not None and not participant.limiter.consume(now):
+            return self.__throttle(participant=participant, scope="connection", notice=b"You are sending too fast, slow down.")
+        
+        address_limits: AddressLimits | None = participant.address_limits
+        if address_limits is not None and address_limits.messages is not None and not address_limits.messages.consume(now):
+            return self.__throttle(participant=participant, scope="address", notice=b"Your address is sending too fast, slow down.")
+        
+        return None
+    
+    
+    def __admit_message(self, participant: Participant, room_id: str) -> bytes | None:
+        max_in_flight_broadcasts: int = self.rate_limits.max_in_flight_broadcasts
+        if self.broker is not None and max_in_flight_broadcasts and self.broker.in_flight_broadcasts >= max_in_flight_broadcasts:
+            return self.__throttle(participant=participant, scope="server", notice=b"The server is busy, your message was dropped.", strike=False)
+        
+        notice: bytes | None = self.__admit_request(participant=participant)
+        if notice is not None:
+            return notice
+        
+        metadata: RoomMetadata = self.get_room(room_id)
+        if metadata.limiter is None:
+            metadata.limiter = self.rate_limits.create_bucket(rate=self.rate_limits.room_message_rate, burst=self.rate_limits.room_message_burst, now=participant.last_seen)
+            
+        if metadata.limiter is not None and not metadata.limiter.consume(participant.last_seen):
+            return self.__throttle(participant=participant, scope="room", notice=b"This room is too busy, your message was dropped.", strike=False)
+        
+        return None
+    
+    
+    async def __ask_username_prompt(self, participant: Participant, prompt: bool = True) -> str | None:
+        outbox = participant.outbox
+        if prompt:
+            outbox.send(encode_frame(FRAME_CONTROL, ASK_USERNAME_PROMPT))
+        
+        while True:
+            frame: Frame | None = await self.__next_frame(participant)
+            if frame is None:
+                return None
+            
+            if frame.type != FRAME_REQUEST:
+                continue
+            
+            correlation_id, command, username_participant = decode_request(frame.payload)
+            self.metrics.count_command(command)
+            
+            notice: bytes | None = self.__admit_request(participant=participant, command=command)
+            if notice is not None:
+                outbox.send(encode_response(correlation_id, STATUS_RATE_LIMITED, notice))
+                continue
+            
+            if command == "/compress":
+                if self.compression_level is None or username_participant != COMPRESSION_ZLIB:
+                    outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"Compression is not available."))
+                    continue
+                
+                outbox.enable_compression(level=self.compression_level, threshold=self.compression_threshold)
+                outbox.send(encode_response(correlation_id, STATUS_OK, COMPRESSION_ZLIB.encode()))
+                continue
+            
+            if command != "/username" or not username_participant:
+                outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"Choose a username first."))
+                continue
+            
+            if len(username_participant.encode()) > 0xFF:
+                outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"Usernames are limited to 255 bytes."))
+                continue
+            
+            username_participant = sys.intern(username_participant)
+            if not await self.presence.claim_username(username=username_participant, participant=participant):
+                outbox.send(encode_response(correlation_id, STATUS_DUPLICATED_USERNAME))
+                continue
+            
+            outbox.send(encode_response(correlation_id, STATUS_OK))
+            break
+        
+        participant.username = username_participant
+        
+        return username_participant
+    
+    
+    def __render_all_rooms_available(self, argument: str = "") -> bytes | None:
+        directory: RoomDirectory = self.store.directory
+        option, _, value = argument.partition(" ")
+        
+        if not option:
+            return directory.render_page(page=1)
+        
+        page = parse_count(value) if option == "page" else None
+        if page is not None:
+            return directory.render_page(page=page)
+        
+        if option == "filter" and value.strip():
+            return directory.render_search(text=value.strip())
+        
+        return None
+    
+    
+    def __render_memory_stats(self) -> bytes:
+        sessions = self.presence.get_all_sessions()
+        total_of_sessions: int = len(sessions)
+        session_bytes: int = sum(pc.get_memory_usage() for pc in sessions)
+        per_session_bytes: int = session_bytes // max(total_of_sessions, 1)
+        
+        rooms = self.get_all_room().values()
+        total_of_rooms: int = len(rooms)
+        room_bytes: int = sum(metadata.get_memory_usage() for metadata in rooms)
+        per_room_bytes: int = room_bytes // max(total_of_rooms, 1)
+        
+        planned_bytes: int = per_session_bytes * self.__capacity_plan_sessions__
+        
+        stats_message = "\n\tMemory usage (approximate)\n"
+        stats_message += f"\t→ Sessions: {total_of_sessions} using {session_bytes} bytes ({per_session_bytes} bytes per session)\n"
+        stats_message += f"\t→ Rooms: {total_of_rooms} using {room_bytes} bytes ({per_room_bytes} bytes per room)\n"
+        stats_message += f"\t→ Capacity: {self.__capacity_plan_sessions__} idle sessions need about {planned_bytes / (1 << 20):.1f} MiB\n"
+        
+        return stats_message.encode()
+        
+
+    @staticmethod
+    def __render_sync(participant: Participant) -> bytes:
+        return f"{participant.messages_accepted} {participant.messages_throttled}".encode()
+        
+
+    def boardcast_message_to_room(self, room_id: str, message: bytes) -> None:
+        if self.broker is not None:
+            self.broker.publish(BUS_BROADCAST, room_id, message)
+            return
+        
+        self.deliver_message_to_room(room_id=room_id, message=message)
+        return
+    
+    
+    def deliver_message_to_room(self, room_id: str, message: bytes) -> None:
+        encoded_message = self.store.append_message(room_id=room_id, message=message)
+        if encoded_message is not None:
+            started = time.perf_counter()
+            participants = self.get_room(room_id).get_all_participants()
+            
+            failed: int = 0
+            compressible: bool = self.compression_level is not None and len(encoded_message) >= self.compression_threshold
+            # Index bit 0 is the room tag and bit 1 compression, each encoding is built once and shared by every member needing it.
+            variants: list[bytes | None] = [encoded_message, None, None, None]
+            for pc in participants:
+                variant: int = pc.multiplexed + (2 if compressible and pc.outbox.compressor is not None else 0)
+                message = variants[variant]
+                if message is None:
+                    message = variants[variant] = self.__encode_variant(room_id=room_id, encoded_message=encoded_message, tagged=bool(variant & 1), compressed=bool(variant & 2))
+                    
+                if not pc.outbox.send_broadcast(message):
+                    failed += 1
+                    
+            if failed:
+                logger.warning("failed to send message", extra={"room_id": room_id, "participants": failed, "reason": "outbox is closed"})
+                    
+            self.metrics.fanout_seconds.observe(time.perf_counter() - started)
+        
+        return
+    
+    
+    def __encode_variant(self, room_id: str, encoded_message: bytes, tagged: bool, compressed: bool) -> bytes:
+        message: bytes = encoded_message
+        if tagged and len(message) <= MAX_ROOM_FRAMES_SIZE:
+            message = encode_room_frame(room_id, message)
+            
+        if compressed:
+            compressed_message = encode_frame(FRAME_COMPRESSED, zlib.compress(message, self.compression_level))
+            if len(compressed_message) < len(message):
+                message = compressed_message
+                
+        return message
+    
+    
+    def render_metrics(self) -> bytes:
+        metrics: ChatMetrics = self.metrics
+        sessions = self.presence.get_all_sessions()
+        
+        metrics.bytes_in.set(metrics.closed_bytes_in + sum(pc.frames.bytes_read for pc in sessions))
+        metrics.bytes_out.set(metrics.closed_bytes_out + sum(pc.outbox.bytes_written for pc in sessions))
+        metrics.dropped.set(metrics.closed_dropped + sum(pc.outbox.dropped for pc in sessions))
+        metrics.queue_depth.set(sum(len(pc.outbox.queue) + len(pc.outbox.control) for pc in sessions), labels=("sum",))
+        metrics.queue_depth.set(max((len(pc.outbox.queue) + len(pc.outbox.control) for pc in sessions), default=0), labels=("max",))
+        
+        return metrics.render()
+    
+    
+    def __account_closed_connection(self, participant: Participant) -> None:
+        self.connections.discard(participant)
+        self.keepalive.cancel(participant)
+        self.__release_address(participant=participant)
+        self.metrics.active_connections.dec()
+        self.metrics.closed_bytes_in += participant.frames.bytes_read
+        self.metrics.closed_bytes_out += participant.outbox.bytes_written
+        self.metrics.closed_dropped += participant.outbox.dropped
+    
+    
+    def apply_broker_event(self, kind: int, origin: int, room_id: str, body: bytes) -> None:
+        if kind == BUS_BROADCAST:
+            self.deliver_message_to_room(room_id=room_id, message=body)
+            
+        elif origin != self.broker.node_id or kind == BUS_NODE_LEFT:
+            self.store.apply(kind=kind, origin=origin, room_id=room_id, body=body)
+            
+        return
+    
+    
+    def __replay_history(self, room_id: str, participant: Participant, count: int) -> int:
+        history: MessageHistory = self.get_room(room_id).history
+        cursor: int = participant.history_cursors.get(room_id, history.next_sequence)
+        start: int = max(cursor - count, history.first_sequence)
+        
+        replayed_messages: bytes = history.read(start=start, stop=cursor)
+        if len(replayed_messages) > MAX_ROOM_FRAMES_SIZE and participant.multiplexed:
+            for sequence in range(start, cursor):
+                participant.send_room_frames(room_id, history.read(start=sequence, stop=sequence + 1), broadcast=True)
+                
+        elif replayed_messages:
+            participant.send_room_frames(room_id, replayed_messages, broadcast=True)
+            
+        participant.history_cursors[room_id] = start
+        return max(cursor - start, 0)
+    
+    
+    def __leave_room(self, room_id: str, participant: Participant) -> None:
+        if self.leave_room(room_id=room_id, username=participant.username) is None:
+            participant.rooms.discard(room_id)
+            participant.history_cursors.pop(room_id, None)
+            return
+        
+        if self.exists_room(room_id):
+            leave_message: str = f"\n\t💥 {participant.username} has left from the chat room.\n"
+            self.boardcast_message_to_room(room_id=room_id, message=leave_message.encode())
+            
+        return
+    
+    
+    def __close_session(self, participant: Participant) -> None:
+        for room_id in list(participant.rooms):
+            self.__leave_room(room_id=room_id, participant=participant)
+            
+        self.presence.release_username(username=participant.username, participant=participant)
+        return
+    
+    
+    def export_session(self, participant: Participant) -> dict:
+        cursors: dict[str, int] = {}
+        for room_id, cursor in participant.history_cursors.items():
+            metadata: RoomMetadata | None = self.get_room(room_id)
+            if metadata is not None:
+                cursors[room_id] = cursor - metadata.history.next_sequence
+                
+        return {
+            "username": participant.username,
+            "rooms": sorted(participant.rooms),
+            "room_id": participant.room_id,
+            "multiplexed": participant.multiplexed,
+            "compressed": participant.outbox.compressor is not None,
+            "cursors": cursors,
+            "pending": base64.b64encode(participant.frames.unread()).decode(),
+        }
+    
+    
+    async def __resume_session(self, participant: Participant, session: dict) -> str | None:
+        username_participant: str = sys.intern(session["username"])
+        if not await self.presence.claim_username(username=username_participant, participant=participant):
+            participant.outbox.send(encode_frame(FRAME_ERROR, b"Your session could not be restored, please reconnect."))
+            return None
+        
+        participant.username = username_participant
+        participant.multiplexed = session["multiplexed"]
+        for room_id in session["rooms"]:
+            if not self.exists_room(room_id):
+                continue
+            
+            # Cursors travel relative to the end of the history since the successor numbers its messages afresh.
+            self.add_participant_to_room(room_id=room_id, participant=participant)
+            if room_id in session["cursors"]:
+                participant.history_cursors[room_id] = self.get_room(room_id).history.next_sequence + session["cursors"][room_id]
+                
+        participant.room_id = session["room_id"] if session["room_id"] in participant.rooms else next(iter(participant.rooms), "")
+        return username_participant
+    
+    
+    async def participant_callback(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, session: dict | None = None) -> None:
+        address: tuple = writer.get_extra_info("peername")
+        frames = FrameReader(reader)
+        outbox = Outbox(
+            writer=writer,
+            capacity=self.outbox_capacity,
+            policy=self.slow_consumer_policy,
+            coalesce_limit=self.outbox_coalesce_limit,
+            flush_interval=self.outbox_flush_interval,
+            high_water=self.outbox_high_water,
+            metrics=self.metrics
+        )
+        participant = Participant(
+            username="",
+            address=address,
+            reader=reader,
+            writer=writer,
+            outbox=outbox,
+            frames=frames,
+            task=asyncio.current_task()
+        )
+        
+        if session is not None:
+            frames.feed(base64.b64decode(session["pending"]))
+            
+        self.connections.add(participant)
+        self.metrics.connections.inc()
+        self.metrics.active_connections.inc()
         
-class RoomStatus(object):
-    def __init__(self, name: str) -> None:
-        self.name = name
+        participant.last_seen = time.monotonic()
+        if not self.__admit_connection(participant=participant) and session is None:
+            logger.warning("rejecting a connection over the address rate limit", extra={"address": address})
+            outbox.send(encode_frame(FRAME_ERROR, b"Too many connections from your address, try again later."))
+            await outbox.close()
+            self.__account_closed_connection(participant=participant)
+            writer.close()
+            return
+        
+        if self.idle_timeout > 0:
+            self.keepalive.schedule(participant, self.heartbeat_interval)
+            
+        if session is not None and session["compressed"] and self.compression_level is not None:
+            outbox.enable_compression(level=self.compression_level, threshold=self.compression_threshold)
+            
+        await self.__serve_participant(participant=participant, session=session)
+        
+        
+    async def resume_participant(self, participant: Participant, session: dict) -> None:
+        participant.task = asyncio.current_task()
+        participant.detached = False
+        participant.outbox.reopen()
+        if session["compressed"] and self.compression_level is not None:
+            participant.outbox.enable_compression(level=self.compression_level, threshold=self.compression_threshold)
+            
+        participant.writer.transport.resume_reading()
+        await self.__serve_participant(participant=participant, session=session)
+        
+        
+    async def __serve_participant(self, participant: Participant, session: dict | None = None) -> None:
+        address: tuple = participant.address
+        outbox: Outbox = participant.outbox
+        writer: asyncio.StreamWriter = participant.writer
+        
+        graceful: bool = False
+        try:
+            if participant.username:
+                # A session kept after a failed handoff still holds its username and rooms.
+                username_participant: str | None = participant.username
+            elif session is None or not session["username"]:
+                username_participant = await self.__ask_username_prompt(participant=participant, prompt=session is None)
+            else:
+                username_participant = await self.__resume_session(participant=participant, session=session)
+                
+            if username_participant is None:
+                return
+            
+            if session is None:
+                welcome_message = f"Hello {username_participant}, Welcome to the chat server that keep simple to use!\n"
+                welcome_message += "\tIf you want to know about the commands, use `/help` to show all commands.\n"
+                
+                logger.info("participant connected", extra={"username": username_participant, "address": address})
+                outbox.send(encode_frame(FRAME_TEXT, welcome_message.encode()))
+                outbox.send(encode_frame(FRAME_TEXT, self.__render_all_rooms_available()))
+            else:
+                logger.info("participant resumed", extra={"username": username_participant, "address": address, "rooms": len(participant.rooms)})
+                
+            await self.__command_loop(participant=participant)
+            graceful = True
+            
+        except ProtocolError as e:
+            logger.warning("closing session after a protocol error", extra={"username": participant.username, "address": address, "error": str(e)})
+            graceful = True
+            
+        except ConnectionError as e:
+            logger.info("lost the connection", extra={"username": participant.username, "address": address, "error": str(e)})
+            
+        except Exception:
+            logger.exception("closing session after an unexpected error", extra={"username": participant.username, "address": address})
+            
+        finally:
+            if not participant.detached:
+                if participant.username:
+                    self.__close_session(participant=participant)
+                    logger.info("participant disconnected", extra={"username": participant.username})
+                    
+                if not graceful:
+                    outbox.abort()
+                    self.__account_closed_connection(participant=participant)
+                    
+        if participant.detached or not graceful:
+            return
+        
+        try:
+            await outbox.close()
+            
+        finally:
+            self.__account_closed_connection(participant=participant)
+            
+        writer.close()
+        try:
+            await writer.wait_closed()
+            
+        except ConnectionError:
+            pass
         
-    def __str__(self) -> str:
-        return self.name
-    
-ROOM_OPENED_STATUS = RoomStatus("opened")
-ROOM_REMOVING_STATUS = RoomStatus("removing")
-
-class RoomMetadata(object):
-    def __init__(self, id: str, title: str) -> None:
-        self.id = id
-        self.title = title
-        self.status = ROOM_OPENED_STATUS
         
-        self.participants: list[Participant] = []
+    async def __command_loop(self, participant: Participant) -> None:
+        outbox: Outbox = participant.outbox
         
+        while True:
+            frame: Frame | None = await self.__next_frame(participant)
+            if frame is None:
+                break
+            
+            if frame.type == FRAME_CHAT:
+                if participant.room_id:
+                    self.__post_message(participant=participant, frame=frame)
+                    
+                continue
+            
+            if frame.type == FRAME_CONTROL:
+                if frame.payload == EXIT_CLI:
+                    logger.info("participant requested to exit", extra={"username": participant.username})
+                    break
+                
+                if frame.payload == EXIT_ROOM:
+                    for room_id in list(participant.rooms):
+                        self.__leave_room(room_id=room_id, participant=participant)
+                        
+                    participant.multiplexed = False
+                    
+                continue
+            
+            if frame.type != FRAME_REQUEST:
+                continue
+            
+            correlation_id, command_execution, argument = decode_request(frame.payload)
+            self.metrics.count_command(command_execution)
+            
+            notice: bytes | None = self.__admit_request(participant=participant, command=command_execution)
+            if notice is not None:
+                outbox.send(encode_response(correlation_id, STATUS_RATE_LIMITED, notice))
+                continue
+            
+            commands = self.room_commands if participant.room_id else self.lobby_commands
+            handler = commands.get(command_execution)
+            if handler is None:
+                outbox.send(encode_response(correlation_id, STATUS_UNKNOWN_COMMAND))
+                continue
+            
+            handler(participant, correlation_id, argument)
         
-    def get_total_of_participants(self) -> int:
-        return len(self.participants)
+        return
     
     
-    def get_all_participants(self) -> list[Participant]:
-        return self.participants
+    def __post_message(self, participant: Participant, frame: Frame) -> None:
+        room_id: str = frame.room or participant.room_id
+        if room_id not in participant.rooms:
+            participant.outbox.send(encode_frame(FRAME_ERROR, f"You are not in room {room_id}, /join it first.".encode()))
+            return
+        
+        notice: bytes | None = self.__admit_message(participant=participant, room_id=room_id)
+        if notice is not None:
+            participant.messages_throttled += 1
+            if not participant.throttled:
+                participant.throttled = True
+                participant.outbox.send(encode_frame(FRAME_ERROR, notice))
+                
+            return
+        
+        participant.throttled = False
+        participant.messages_accepted += 1
+        formatted_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        message = f"[{formatted_timestamp}] {participant.username}: {frame.text().strip()}"
+        self.boardcast_message_to_room(room_id=room_id, message=encode_chat(participant.username, message.encode()))
+        return
     
     
-    def get_all_username_participants(self) -> list[str]:
-        usernames: list[str] = []
-        for pc in self.participants:
-            usernames.append(pc.username)
+    def __list_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        room_listing: bytes | None = self.__render_all_rooms_available(argument=argument)
+        if room_listing is None:
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"Usage: /list [page <n> | filter <text>]"))
+            return
         
-        return usernames
-    
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, room_listing))
+        return
     
-    def exists_username_participant(self, username: str) -> bool:
-        usernames: list[str] = self.get_all_username_participants()
-        return username in usernames
     
+    def __connect_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        room_id = argument.upper()
         
-    def add_participant(self, pariticpant: Participant) -> None:
-        return self.participants.append(pariticpant)
-    
+        participant.multiplexed = False
+        status: int = self.join_room(room_id=room_id, participant=participant)
+        if status != STATUS_OK:
+            participant.outbox.send(encode_response(correlation_id, status))
+            return
         
-    def remove_participant(self, username: str) -> None:
-        for pc in self.participants:
-            if pc.username == username:
-                self.participants.remove(pc)
-                return
-          
-class Room:
-    __length_of_room_id__: int = 6
-    __rooms__: dict[str, RoomMetadata] = {}
-    
-    
-    def __room_id_generator(self, n: int) -> str:
-        return "".join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(n))
-    
-
-    def exists_room(self, id) -> bool:
-        return id in self.__rooms__
-    
-    
-    def get_room(self, id) -> dict[str, RoomMetadata] | None:
-        if id in self.__rooms__:
-            return self.__rooms__[id]
+        room_title: str = self.get_room(room_id).title
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, room_title.encode()))
         
-        return None
-    
-    
-    def get_total_of_rooms(self) -> int:
-        return len(self.__rooms__)
-    
+        self.__replay_history(room_id=room_id, participant=participant, count=self.history_replay)
+        
+        joined_message: str = f"\n\t🥂 {participant.username} has joined the chat room.\n"
+        self.boardcast_message_to_room(room_id=room_id, message=joined_message.encode())
+        return
     
-    def get_all_room(self) -> dict[str, RoomMetadata]:
-        return self.__rooms__
     
+    def __join_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        room_id = argument.upper()
+        
+        if room_id in participant.rooms:
+            # A session that /connect-ed into this room is switching to room frames now.
+            participant.multiplexed = True
+            participant.room_id = room_id
+            participant.outbox.send(encode_response(correlation_id, STATUS_OK, self.get_room(room_id).title.encode()))
+            return
+        
+        if len(participant.rooms) >= self.__max_rooms_per_session__:
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, f"A session can follow at most {self.__max_rooms_per_session__} rooms.".encode()))
+            return
+        
+        status: int = self.join_room(room_id=room_id, participant=participant)
+        if status != STATUS_OK:
+            participant.outbox.send(encode_response(correlation_id, status))
+            return
+        
+        participant.multiplexed = True
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, self.get_room(room_id).title.encode()))
+        
+        self.__replay_history(room_id=room_id, participant=participant, count=self.history_replay)
+        
+        joined_message: str = f"\n\t🥂 {participant.username} has joined the chat room.\n"
+        self.boardcast_message_to_room(room_id=room_id, message=joined_message.encode())
+        return
     
-    def add_participant_to_room(self, room_id: str, participant: Participant) -> None:
-        self.__rooms__[room_id].add_participant(pariticpant=participant)
     
+    def __leave_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        room_id = argument.upper() or participant.room_id
+        
+        if room_id not in participant.rooms:
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, f"You are not in room {room_id}.".encode()))
+            return
+        
+        self.__leave_room(room_id=room_id, participant=participant)
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, participant.room_id.encode()))
+        return
     
-    def remove_participant_from_room(self, room_id: str, username: str) -> None:
-        self.__rooms__[room_id].remove_participant(username=username)
     
+    def __switch_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        room_id = argument.upper()
+        
+        if room_id not in participant.rooms:
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, f"You are not in room {room_id}, /join it first.".encode()))
+            return
+        
+        participant.room_id = room_id
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, self.get_room(room_id).title.encode()))
+        return
     
-    def get_all_username_participants(self, room_id: str) -> list[str]:
-        for id, metadata in self.__rooms__.items():
-            if id == room_id:
-                usernames = metadata.get_all_username_participants()
-                return usernames
-            
     
-    def get_total_of_participants(self, room_id: str) -> int:
-        for id, metadata in self.__rooms__.items():
-            if id == room_id:
-                total_of_participants = metadata.get_total_of_participants()
-                return total_of_participants
+    def __sync_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, self.__render_sync(participant=participant)))
+        return
     
     
-    def create_room(self, title: str) -> None:
-        room_id = self.__room_id_generator(self.__length_of_room_id__)
-        self.__rooms__[room_id] = RoomMetadata(id=room_id, title=title)
+    def __stats_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        if participant.address[0] not in LOOPBACK_HOSTS:
+            participant.outbox.send(encode_response(correlation_id, STATUS_FORBIDDEN, b"Stats are only available from the server host."))
+            return
+        
+        if argument != "memory":
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"Usage: /stats memory"))
+            return
+        
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, self.__render_memory_stats()))
         return
     
     
-    def set_status_room(self, room_id: str, status: RoomStatus) -> None:
-        self.__rooms__[room_id].status = status
+    def __create_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        if not argument:
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"A room title is required."))
+            return
+        
+        if len(argument.encode()) > MAX_TITLE_SIZE:
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"Room titles are limited to 255 bytes."))
+            return
+        
+        room_id = self.create_room(title=argument)
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, room_id.encode()))
         return
     
     
-    def remove_room(self, room_id: str) -> None:        
-        del self.__rooms__[room_id]
+    def __remove_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        status: int = self.close_room(room_id=argument.upper())
+        participant.outbox.send(encode_response(correlation_id, status))
         return
     
     
-    def get_room_status(self, room_id: str) -> RoomStatus:
-        return self.__rooms__[room_id].status
-
-class Chat(Room):
-    __usernames__: list[str] = []
-    
-    async def __ask_username_prompt(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str:
-        while True:
-            username_prompt_message: str = "[#ask_username_prompt]"
-            writer.write(username_prompt_message.encode())
-            await writer.drain()
-                
-            stream_data = await reader.read(1024)
-            username_participant = stream_data.decode().strip()
-            
-            if username_participant in self.__usernames__:
-                duplicated_username: str = "[#duplicated_username]"
-                
-                writer.write(duplicated_username.encode())
-                await writer.drain()
-                continue
-            
-            verified_username: str = "[#verified_username]"
-            writer.write(verified_username.encode())
-            await writer.drain()
-            
-            break
+    def __history_command(self, participant: Participant, correlation_id: int, argument: str) -> None:
+        count: int | None = parse_count(argument) if argument else self.history_replay
+        if count is None or count < 1:
+            participant.outbox.send(encode_response(correlation_id, STATUS_BAD_REQUEST, b"Usage: /history <n>"))
+            return
         
-        self.__usernames__.append(username_participant)
+        replayed: int = self.__replay_history(room_id=participant.room_id, participant=participant, count=count)
+        participant.outbox.send(encode_response(correlation_id, STATUS_OK, str(replayed).encode()))
+        return
         
-        verified_username: str = "[#ask_username_prompt]"
-        writer.write(verified_username.encode())
+class Server(Chat):
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        outbox_capacity: int = 256,
+        slow_consumer_policy: SlowConsumerPolicy = DROP_OLDEST_POLICY,
+        outbox_flush_interval: float = 0.0,
+        outbox_high_water: int = 64 << 10,
+        history_capacity: int = 256,
+        history_byte_budget: int = 1 << 20,
+        history_replay: int = 20,
+        heartbeat_interval: float = 30.0,
+        idle_timeout: float = 90.0,
+        rate_limits: RateLimits | None = None,
+        compression_level: int | None = 6,
+        compression_threshold: int = 256,
+        room_store: RoomStore | None = None,
+        metrics_hostname: str = "127.0.0.1",
+        metrics_port: int | None = None,
+        reuse_port: bool = False,
+        drain_timeout: float = 10.0,
+        handoff_path: str | None = None
+    ) -> None:
+        super().__init__(
+            outbox_capacity=outbox_capacity,
+            slow_consumer_policy=slow_consumer_policy,
+            outbox_flush_interval=outbox_flush_interval,
+            outbox_high_water=outbox_high_water,
+            history_capacity=history_capacity,
+            history_byte_budget=history_byte_budget,
+            history_replay=history_replay,
+            heartbeat_interval=heartbeat_interval,
+            idle_timeout=idle_timeout,
+            rate_limits=rate_limits,
+            compression_level=compression_level,
+            compression_threshold=compression_threshold,
+            room_store=room_store
+        )
         
-        return username_participant
-    
-    
-    async def __list_all_rooms_available(self, writer: asyncio.StreamWriter) -> None:
-        total_rooms = self.get_total_of_rooms()
-        available_message = f"\n\tAll rooms available ({total_rooms} rooms)\n"
-        if total_rooms < 1:
-            available_message += "\t🚫 There are no rooms available.\n"
-        else:
-            rooms = self.get_all_room()
-            for id, metadata in rooms.items():
-                available_message += f"\t→ [ID: {id}] {metadata.title} ({metadata.get_total_of_participants()} participants)\n"
-            
-        encoded_message = available_message.encode()
-        if len(encoded_message) > 8196:
-            writer.write(b"\n\tUnable to show all rooms available because encode message is too large!\n")
-            await writer.drain()
-            
-        writer.write(encoded_message)
-        await writer.drain()
+        self.hostname = hostname
+        self.port = port
+        self.reuse_port = reuse_port
+        self.server = None
+        self.servers: list[asyncio.Server] = []
+        self.broker_task = None
+        self.clients: set[asyncio.Task] = set()
+        self.stopped = asyncio.Event()
         
-
-    async def boardcast_message_to_room(self, room_id: str, message: bytes) -> None:
-        rooms = self.get_all_room()
-        if room_id in rooms:
-            metadata = rooms[room_id]
-            participants = metadata.get_all_participants()
-
-            if participants:
-                for pc in participants:
-                    try:
-                        pc.writer.write(message)
-                        await pc.writer.drain()
-                        
-                    except Exception as e:
-                        print(f"Failed to send message to {pc.username}: {e}")
+        self.drain_timeout = drain_timeout
+        self.handoff_path = handoff_path
+        self.handoff_task = None
+        self.inherited_listeners: list[socket.socket] = []
+        self.inherited_sessions: list[tuple[socket.socket, dict]] = []
         
-        return
+        self.metrics_hostname = metrics_hostname
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.loop_lag_task = None
+        self.reaper_task = None
         
+    async def callback(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, session: dict | None = None, participant: Participant | None = None):
+        client_task = asyncio.current_task()
+        self.clients.add(client_task)
         
-    async def participant_callback(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-        address: tuple = writer.get_extra_info("peername")
-        username_participant: str = await self.__ask_username_prompt(reader=reader, writer=writer)
-                
-        welcome_message = f"Hello {username_participant}, Welcome to the chat server that keep simple to use!\n"
-        welcome_message += "\tIf you want to know about the commands, use `/help` to show all commands.\n"
+        try:
+            if participant is None:
+                await self.participant_callback(reader, writer, session=session)
+            else:
+                await self.resume_participant(participant=participant, session=session)
+            
+        except asyncio.CancelledError:
+            pass
         
-        writer.write(welcome_message.encode())
-        await writer.drain()
+        finally:
+            self.clients.discard(client_task)
+            
+    async def connect_broker(self, address: str):
+        self.broker = await BrokerLink.connect(address=address)
+        self.store = BrokerRoomStore(
+            link=self.broker,
+            history_capacity=self.history_capacity,
+            history_byte_budget=self.history_byte_budget
+        )
+        self.presence = BrokerPresenceStore(link=self.broker)
+        self.broker_task = asyncio.create_task(self.broker.run(on_event=self.apply_broker_event))
         
-        await self.__list_all_rooms_available(writer=writer)
+    def restore_handoff(self, fds: list[int], payload: bytes) -> None:
+        # The payload is one JSON line describing listeners and sessions, followed by the rooms as bus events.
+        encoded_header, _, encoded_rooms = payload.partition(b"\n")
+        header: dict = json.loads(encoded_header)
         
-        while True:
-            current_timestamp = datetime.now()
-            formatted_timestamp = current_timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            
-            stream_data = await reader.read(1024)
-            command_execution = stream_data.decode().strip()
+        listener_count: int = header["listeners"]
+        self.inherited_listeners = [socket.socket(fileno=fd) for fd in fds[:listener_count]]
+        self.inherited_sessions = [(socket.socket(fileno=fd), session) for fd, session in zip(fds[listener_count:], header["sessions"])]
+        
+        for frame in FrameDecoder().feed(encoded_rooms):
+            if frame.type != FRAME_BUS_EVENT or isinstance(self.store, DurableRoomStore):
+                continue
             
-            match command_execution:
-                case "/list":
-                    await self.__list_all_rooms_available(writer=writer)
-                    continue
-                    
-                case "/connect":
-                    stream_data = await reader.read(1024)
-                    room_id = stream_data.decode().strip().upper()
-                    
-                    is_exists = self.exists_room(room_id)
-                    if not is_exists:
-                        writer.write(b"[#no_available_room]")
-                        await writer.drain()
-                        continue
-                    
-                    else:
-                        writer.write(b"[#continue]")
-                        await writer.drain()
-                        
-                    await asyncio.sleep(2)
-                          
-                    got_status = self.get_room_status(room_id=room_id)
-                    if got_status == ROOM_REMOVING_STATUS:
-                        writer.write(b"[#room_removing]")
-                        await writer.drain()
-                        continue
-                    
-                    else:
-                        writer.write(b"[#continue]")
-                        await writer.drain()
-                    
-                    stream_data = await reader.read(64)
-                    username_joined = stream_data.decode().strip()
-                    
-                    joined_message: str = f"\n\t🥂 {username_joined} has joined the chat room.\n"
-                    asyncio.create_task(
-                        self.boardcast_message_to_room(
-                            room_id=room_id,
-                            message=joined_message.encode()
-                        )
-                    )
-                    
-                    self.add_participant_to_room(
-                        room_id=room_id,
-                        participant=Participant(
-                            username=username_participant,
-                            address=address,
-                            reader=reader,
-                            writer=writer
-                        )
-                    )
-                    
-                    while True:
-                        stream_data = await reader.read(1024)
-                                                    
-                        if b"[#exit_room]" in stream_data:
-                            self.remove_participant_from_room(room_id=room_id, username=username_participant)
-                            leave_message: str = f"\n\t💥 {username_participant} has left from the chat room.\n"
-                            
-                            await asyncio.sleep(0.5)
-                            asyncio.create_task(
-                                self.boardcast_message_to_room(
-                                    room_id=room_id,
-                                    message=leave_message.encode()
-                                )
-                            )
-                            
-                            room_status: RoomStatus = self.get_room_status(room_id=room_id)
-                            total_of_participants: int = self.get_total_of_participants(room_id=room_id)
-                            if total_of_participants < 1 and room_status is ROOM_REMOVING_STATUS:
-                                self.remove_room(room_id=room_id)
-                            
-                            break
-                        
-                        message = f"[{formatted_timestamp}] {username_participant}: {stream_data.decode().strip()}"
-                        asyncio.create_task(
-                            self.boardcast_message_to_room(
-                                room_id=room_id,
-                                message=message.encode()
-                            )
-                        )
-                        
-                    continue
+            kind, _, room_id, body = decode_bus_event(frame.payload)
+            if kind == BUS_CREATE_ROOM:
+                self.store.create_room(room_id=room_id, title=body.decode())
                 
-                case "/create":
-                    stream_data = await reader.read(1024)
-                    room_title = stream_data.decode().strip()
-                    
-                    self.create_room(title=room_title)
-                    
-                    writer.write(b"[#create_room_successfully]")
-                    await writer.drain()
-                    
-                    continue
-                    
-                case "/remove":
-                    stream_data = await reader.read(1024)
-                    room_id = stream_data.decode().strip().upper()
-                    
-                    is_exists = self.exists_room(room_id)
-                    if not is_exists:
-                        writer.write(b"[#no_available_room]")
-                        await writer.drain()
-                        continue
-                    else:
-                        writer.write(b"[#continue]")
-                        await writer.drain()
-                        
-                    self.set_status_room(room_id=room_id, status=ROOM_REMOVING_STATUS)
-                    
-                    participants: list[str] = self.get_all_username_participants(room_id=room_id)
-                    if len(participants) < 1:
-                        self.remove_room(room_id=room_id)
-                        
-                    continue
+            elif kind == BUS_SET_STATUS:
+                self.store.set_status_room(room_id=room_id, status=RoomStatus(body.decode()))
                 
-                case "/exit":
-                    stream_data = await reader.read(1024)
-                    if b"[#exit_cli]" in stream_data:
-                        print(f"\n💡 {username_participant} has requested to exit.\n")
-                        break
-            
-            continue
+            elif kind == BUS_BROADCAST:
+                self.store.append_message(room_id=room_id, message=body)
+                
+        logger.info("took over from the previous server", extra={"listeners": len(self.inherited_listeners), "sessions": len(self.inherited_sessions), "rooms": self.get_total_of_rooms()})
         
-        print(f"❗️ \n{username_participant} has disconnected.\n")
-        writer.close()
-        await writer.wait_closed()
+    def __export_rooms(self) -> list[bytes]:
+        events: list[bytes] = []
+        if isinstance(self.store, DurableRoomStore):
+            return events
         
-class Server(Chat):
-    def __init__(self, hostname: str, port: int) -> None:
-        super().__init__()
+        for room_id, metadata in self.get_all_room().items():
+            events.append(encode_bus_event(BUS_CREATE_ROOM, 0, room_id, metadata.title.encode()))
+            if metadata.status is not ROOM_OPENED_STATUS:
+                events.append(encode_bus_event(BUS_SET_STATUS, 0, room_id, metadata.status.value.encode()))
+                
+            history: MessageHistory = metadata.history
+            for sequence in range(history.first_sequence, history.next_sequence):
+                events.append(encode_bus_event(BUS_BROADCAST, 0, room_id, history.read(start=sequence, stop=sequence + 1)[FRAME_HEADER.size:]))
+                
+        return events
+    
+    async def __stop_background(self) -> None:
+        for server in self.servers:
+            server.close()
+            
+        if self.metrics_server:
+            await self.metrics_server.close()
+            
+        if self.loop_lag_task:
+            self.loop_lag_task.cancel()
+            
+        if self.reaper_task:
+            self.reaper_task.cancel()
+            
+    async def __detach_sessions(self) -> list[Participant]:
+        participants: list[Participant] = list(self.connections)
+        for participant in participants:
+            participant.detached = True
+            participant.writer.transport.pause_reading()
+            if participant.task is not None:
+                participant.task.cancel()
+                
+        await asyncio.gather(*(participant.task for participant in participants if participant.task is not None), return_exceptions=True)
+        return participants
+    
+    async def __resume_after_handoff(self, listener_fds: list[int], participants: list[Participant], sessions: list[dict]) -> None:
+        self.store.reopen()
+        self.servers = [await asyncio.start_server(self.callback, sock=socket.socket(fileno=fd)) for fd in listener_fds]
+        self.server = self.servers[0]
         
-        self.hostname = hostname
-        self.port = port
-        self.server = None
-        self.clients: set[asyncio.Task] = set()
+        if self.idle_timeout > 0:
+            self.reaper_task = asyncio.create_task(self.reap_idle_forever())
+            
+        for participant, session in zip(participants, sessions):
+            asyncio.create_task(self.callback(participant.reader, participant.writer, session=session, participant=participant))
+            
+    async def hand_off(self, connection: socket.socket) -> bool:
+        print("\n🔁 Chat CLI is handing its sessions over to the new server...")
+        # Nothing is torn down before the successor acknowledges, so a failed handoff resumes everything here.
+        # The listeners stop accepting but stay open through their duplicates, which keeps pending connections queued.
+        listener_fds: list[int] = [os.dup(sock.fileno()) for server in self.servers for sock in server.sockets]
+        for server in self.servers:
+            server.close()
+            
+        if self.reaper_task:
+            self.reaper_task.cancel()
+            
+        participants: list[Participant] = await self.__detach_sessions()
+        sessions: list[dict] = [self.export_session(participant) for participant in participants]
+        detached: list[bool] = await asyncio.gather(*(participant.outbox.detach(timeout=self.drain_timeout) for participant in participants))
         
-    async def callback(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        client_task = asyncio.create_task(self.participant_callback(reader, writer))
-        self.clients.add(client_task)
+        session_fds: list[int] = []
+        handed_off_sessions: list[dict] = []
+        for participant, session, handed_off in zip(participants, sessions, detached):
+            if handed_off:
+                session_fds.append(os.dup(participant.writer.get_extra_info("socket").fileno()))
+                handed_off_sessions.append(session)
+                
+        # The successor recovers the durable log as soon as it acknowledges, so it is closed first and reopened on failure.
+        await self.store.close()
         
+        header: bytes = json.dumps({"listeners": len(listener_fds), "sessions": handed_off_sessions}).encode()
+        payload: bytes = header + b"\n" + b"".join(self.__export_rooms())
         try:
-            await client_task
+            await asyncio.get_running_loop().run_in_executor(None, send_handoff, connection, listener_fds + session_fds, payload)
             
-        except asyncio.CancelledError:
-            pass
+        except Exception as e:
+            logger.error("handoff to the new server failed, resuming the sessions", extra={"error": str(e), "sessions": len(participants)})
+            for fd in session_fds:
+                os.close(fd)
+                
+            await self.__resume_after_handoff(listener_fds=listener_fds, participants=participants, sessions=sessions)
+            print(f"\n🚫 Handoff failed ({e}), Chat CLI keeps serving.")
+            return False
         
-        finally:
-            self.clients.remove(client_task)
+        for fd in listener_fds + session_fds:
+            os.close(fd)
             
-            writer.close()
-            await writer.wait_closed()
+        for participant in participants:
+            participant.writer.transport.abort()
+            self.keepalive.cancel(participant)
+            
+        await self.__stop_background()
         
+        logger.info("handed off to the new server", extra={"sessions": len(handed_off_sessions), "dropped": len(participants) - len(handed_off_sessions), "rooms": self.get_total_of_rooms()})
+        print("\n✅ Server has handed off its sessions.")
+        return True
+        
+    async def __await_successor(self) -> None:
+        # A successor that fails leaves this server running, and the next one may try again.
+        handed_off: bool = False
+        try:
+            while not handed_off:
+                connection: socket.socket = await accept_successor(path=self.handoff_path)
+                try:
+                    handed_off = await self.hand_off(connection=connection)
+                    
+                finally:
+                    connection.close()
+                    
+        except Exception:
+            self.stopped.set()
+            raise
+        
+        self.stopped.set()
+            
     async def run(self):
-        self.server = await asyncio.start_server(
-            client_connected_cb=self.participant_callback,
-            host=self.hostname,
-            port=self.port
-        )
-        print(f"\n🎉 Chat CLI is listening on {self.hostname}:{self.port}\n")
+        if self.inherited_listeners:
+            self.servers = [await asyncio.start_server(self.callback, sock=sock) for sock in self.inherited_listeners]
+        else:
+            self.servers = [await asyncio.start_server(
+                client_connected_cb=self.callback,
+                host=self.hostname,
+                port=self.port,
+                reuse_port=self.reuse_port
+            )]
+            
+        self.server = self.servers[0]
         
-        async with self.server:
-            await self.server.serve_forever()
+        logger.info("server started", extra={"address": f"{self.hostname}:{self.port}", "loop": type(asyncio.get_running_loop()).__module__.partition(".")[0]})
+        if self.broker is None:
+            print(f"\n🎉 Chat CLI is listening on {self.hostname}:{self.port}\n")
+        else:
+            print(f"\n🎉 Chat CLI node {self.broker.node_id} (pid {os.getpid()}) is listening on {self.hostname}:{self.port}\n")
             
-    async def shutdown(self):
-        print("\n⚡️ Chat CLI is shutting down...")
-        if self.server:
-            self.server.close()
-            await self.server.wait_closed()
-
+        for sock, session in self.inherited_sessions:
+            reader, writer = await asyncio.open_connection(sock=sock)
+            asyncio.create_task(self.callback(reader, writer, session=session))
+            
+        if self.inherited_sessions:
+            print(f"🔁 Resumed {len(self.inherited_sessions)} sessions from the previous server\n")
+            self.inherited_sessions.clear()
+            
+        self.loop_lag_task = asyncio.create_task(self.metrics.monitor_loop_lag())
+        if self.idle_timeout > 0:
+            self.reaper_task = asyncio.create_task(self.reap_idle_forever())
+            
+        if self.metrics_port is not None:
+            metrics_port: int = self.metrics_port + (self.broker.node_id - 1 if self.reuse_port and self.broker else 0)
+            self.metrics_server = MetricsServer(render=self.render_metrics, hostname=self.metrics_hostname, port=metrics_port)
+            await self.metrics_server.start()
+            
+            print(f"📈 Metrics are served on http://{self.metrics_hostname}:{metrics_port}/metrics\n")
+            
+        if self.handoff_path is not None:
+            self.handoff_task = asyncio.create_task(self.__await_successor())
+            print(f"🔁 A new server can take over through {self.handoff_path}\n")
+        
+        waiters: list[asyncio.Task] = [asyncio.create_task(self.stopped.wait())]
+        if self.broker_task is not None:
+            waiters.append(self.broker_task)
+            
+        try:
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in done:
+                waiter.result()
+                
+            # A handoff that could not resume its sessions ends the server with that error rather than a clean exit.
+            if self.handoff_task is not None and self.handoff_task.done() and not self.handoff_task.cancelled():
+                self.handoff_task.result()
+                
+        finally:
+            waiters[0].cancel()
+            for server in self.servers:
+                server.close()
+            
+    async def drain(self) -> None:
+        participants: list[Participant] = await self.__detach_sessions()
+        notice: bytes = encode_frame(FRAME_ERROR, b"The server is shutting down, please reconnect in a moment.")
+        for participant in participants:
+            participant.outbox.send(notice)
+            
+        closing: dict[asyncio.Task, Participant] = {asyncio.create_task(self.__close_connection(participant)): participant for participant in participants}
+        if closing:
+            _, pending = await asyncio.wait(closing, timeout=self.drain_timeout)
+            if pending:
+                logger.warning("drain deadline passed, aborting connections", extra={"connections": len(pending), "drain_timeout": self.drain_timeout})
+                
+            for task in pending:
+                task.cancel()
+                closing[task].outbox.abort()
+                
         for client in self.clients:
             client.cancel()
         
         await asyncio.gather(*self.clients, return_exceptions=True)
         
+    @staticmethod
+    async def __close_connection(participant: Participant) -> None:
+        await participant.outbox.close()
+        participant.writer.close()
+        try:
+            await participant.writer.wait_closed()
+            
+        except ConnectionError:
+            pass
+            
+    async def shutdown(self):
+        print("\n⚡️ Chat CLI is shutting down...")
+        if self.handoff_task:
+            self.handoff_task.cancel()
+            
+        await self.__stop_background()
+        await self.drain()
+        self.stopped.set()
+        
         print("\n✅ Server has been shut down gracefully.")
 
-async def main():
+def parse_arguments() -> argparse.Namespace:
     TCP_HOSTNAME: str = "127.0.0.1"
     TCP_PORT: int = 9000
+    OUTBOX_CAPACITY: int = 256
+    SLOW_CONSUMER_POLICY: SlowConsumerPolicy = DROP_OLDEST_POLICY
+    HISTORY_CAPACITY: int = 256
+    HISTORY_BYTE_BUDGET: int = 1 << 20
+    HISTORY_REPLAY: int = 20
+    RATE_LIMITS: RateLimits = RateLimits()
+    
+    parser = argparse.ArgumentParser(description="Chat CLI server")
+    parser.add_argument("--host", default=TCP_HOSTNAME)
+    parser.add_argument("--port", type=int, default=TCP_PORT)
+    parser.add_argument("--workers", type=int, default=1, help="number of processes sharing the port through SO_REUSEPORT")
+    parser.add_argument("--loop", default="auto", choices=LOOP_BACKENDS, help="event loop backend, auto prefers uvloop when it is installed")
+    parser.add_argument("--broker", default=None, help="share rooms and usernames through a broker at HOST:PORT or a Unix socket path")
+    parser.add_argument("--data-dir", default=None, help="persist rooms and messages to a write-ahead log in this directory")
+    parser.add_argument("--drain-timeout", type=float, default=10.0, help="seconds a shutdown or handoff waits for queued messages to reach clients")
+    parser.add_argument("--handoff-socket", default=None, help="hand the listening socket, rooms and sessions to a new server connecting to this Unix socket path")
+    parser.add_argument("--takeover", default=None, help="take over the listening socket, rooms and sessions from the server handing off through this Unix socket path")
+    parser.add_argument("--metrics-host", default=TCP_HOSTNAME)
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this port; workers use consecutive ports")
+    parser.add_argument("--outbox-capacity", type=int, default=OUTBOX_CAPACITY)
+    parser.add_argument(
+        "--slow-consumer-policy",
+        type=SlowConsumerPolicy,
+        choices=list(SlowConsumerPolicy),
+        default=SLOW_CONSUMER_POLICY
+    )
+    parser.add_argument("--outbox-flush-window", type=int, default=0, help="microseconds an outbox waits to gather messages into one write, 0 flushes every loop tick")
+    parser.add_argument("--outbox-high-water", type=int, default=64 << 10, help="buffered bytes per connection before the writer waits for the socket to drain")
+    parser.add_argument("--history-capacity", type=int, default=HISTORY_CAPACITY, help="messages kept per room")
+    parser.add_argument("--history-bytes", type=int, default=HISTORY_BYTE_BUDGET, help="byte budget of the history kept per room")
+    parser.add_argument("--history-replay", type=int, default=HISTORY_REPLAY, help="messages replayed to a participant on join")
+    parser.add_argument("--heartbeat-interval", type=float, default=30.0, help="seconds of silence before the server pings a client")
+    parser.add_argument("--idle-timeout", type=float, default=90.0, help="seconds of silence before a connection is closed, 0 disables")
+    parser.add_argument("--message-rate", type=float, default=RATE_LIMITS.message_rate, help="messages and requests per second per connection, 0 disables")
+    parser.add_argument("--message-burst", type=int, default=RATE_LIMITS.message_burst)
+    parser.add_argument("--ip-message-rate", type=float, default=RATE_LIMITS.ip_message_rate, help="messages and requests per second per client address, 0 disables")
+    parser.add_argument("--ip-message-burst", type=int, default=RATE_LIMITS.ip_message_burst)
+    parser.add_argument("--room-message-rate", type=float, default=RATE_LIMITS.room_message_rate, help="messages per second per room on each server, 0 disables")
+    parser.add_argument("--room-message-burst", type=int, default=RATE_LIMITS.room_message_burst)
+    parser.add_argument("--ip-connect-rate", type=float, default=RATE_LIMITS.ip_connect_rate, help="new connections per second per client address, 0 disables")
+    parser.add_argument("--ip-connect-burst", type=int, default=RATE_LIMITS.ip_connect_burst)
+    parser.add_argument("--flood-tolerance", type=int, default=RATE_LIMITS.flood_tolerance, help="throttled messages a client may send before it is disconnected, 0 disables")
+    parser.add_argument("--max-in-flight-broadcasts", type=int, default=RATE_LIMITS.max_in_flight_broadcasts, help="broadcasts awaiting the broker before messages are dropped, 0 disables")
+    parser.add_argument("--no-rate-limits", action="store_true", help="disable every rate limit, for benchmarks")
+    parser.add_argument("--compression-level", type=int, default=6, choices=range(1, 10), metavar="{1..9}", help="zlib level for clients that negotiate compression")
+    parser.add_argument("--compression-threshold", type=int, default=256, help="frames smaller than this many bytes are sent uncompressed")
+    parser.add_argument("--no-compression", action="store_true", help="refuse compression negotiated by clients")
+    parser.add_argument("--log-level", default="info", choices=("debug", "info", "warning", "error"))
+    parser.add_argument("--log-file", default=None, help="write JSON-lines logs to this file with size-based rotation; workers add their pid")
+    parser.add_argument("--log-max-bytes", type=int, default=16 << 20)
+    parser.add_argument("--log-backups", type=int, default=5)
+    
+    arguments = parser.parse_args()
+    if arguments.data_dir is not None and (arguments.workers > 1 or arguments.broker is not None):
+        parser.error("--data-dir can only be used by a single server without --workers or --broker")
+        
+    if (arguments.handoff_socket is not None or arguments.takeover is not None) and (arguments.workers > 1 or arguments.broker is not None):
+        parser.error("--handoff-socket and --takeover can only be used by a single server without --workers or --broker")
+        
+    return arguments
+
+def build_rate_limits(arguments: argparse.Namespace) -> RateLimits:
+    if arguments.no_rate_limits:
+        return RateLimits.unlimited()
+    
+    return RateLimits(
+        message_rate=arguments.message_rate,
+        message_burst=arguments.message_burst,
+        ip_message_rate=arguments.ip_message_rate,
+        ip_message_burst=arguments.ip_message_burst,
+        room_message_rate=arguments.room_message_rate,
+        room_message_burst=arguments.room_message_burst,
+        ip_connect_rate=arguments.ip_connect_rate,
+        ip_connect_burst=arguments.ip_connect_burst,
+        flood_tolerance=arguments.flood_tolerance,
+        max_in_flight_broadcasts=arguments.max_in_flight_broadcasts
+    )
+
+async def serve(arguments: argparse.Namespace, broker_address: str | None = None):
+    handoff: tuple[list[int], bytes] | None = None
+    if arguments.takeover is not None:
+        handoff = await take_over(path=arguments.takeover)
+        
+    room_store = None
+    if arguments.data_dir is not None:
+        room_store = DurableRoomStore(
+            log=MessageLog(directory=arguments.data_dir),
+            history_capacity=arguments.history_capacity,
+            history_byte_budget=arguments.history_bytes
+        )
+        room_store.recover()
+        
+    server = Server(
+        hostname=arguments.host,
+        port=arguments.port,
+        outbox_capacity=arguments.outbox_capacity,
+        slow_consumer_policy=arguments.slow_consumer_policy,
+        outbox_flush_interval=arguments.outbox_flush_window / 1_000_000,
+        outbox_high_water=arguments.outbox_high_water,
+        history_capacity=arguments.history_capacity,
+        history_byte_budget=arguments.history_bytes,
+        history_replay=arguments.history_replay,
+        heartbeat_interval=arguments.heartbeat_interval,
+        idle_timeout=arguments.idle_timeout,
+        rate_limits=build_rate_limits(arguments=arguments),
+        compression_level=None if arguments.no_compression else arguments.compression_level,
+        compression_threshold=arguments.compression_threshold,
+        room_store=room_store,
+        metrics_hostname=arguments.metrics_host,
+        metrics_port=arguments.metrics_port,
+        reuse_port=arguments.workers > 1,
+        drain_timeout=arguments.drain_timeout,
+        handoff_path=arguments.handoff_socket
+    )
     
-    server = Server(hostname=TCP_HOSTNAME, port=TCP_PORT)
+    if handoff is not None:
+        server.restore_handoff(*handoff)
+    
+    if broker_address is not None:
+        await server.connect_broker(address=broker_address)
     
     def signal_handler():
         asyncio.create_task(server.shutdown())
@@ -424,6 +2472,100 @@ async def main():
         
     except asyncio.CancelledError:
         pass
+    
+    finally:
+        await server.store.close()
+
+def start_logging(arguments: argparse.Namespace, suffix: str = ""):
+    return setup_logging(
+        level=arguments.log_level,
+        path=arguments.log_file + suffix if arguments.log_file else None,
+        max_bytes=arguments.log_max_bytes,
+        backup_count=arguments.log_backups
+    )
+
+def run_worker(arguments: argparse.Namespace, broker_address: str):
+    log_listener = start_logging(arguments=arguments, suffix=f".{os.getpid()}")
+    try:
+        run_event_loop(serve(arguments=arguments, broker_address=broker_address), backend=arguments.loop)
+        
+    except ConnectionError as e:
+        logger.error("worker lost the broker", extra={"pid": os.getpid(), "error": str(e)})
+        
+    finally:
+        log_listener.stop()
+
+async def run_local_broker(path: str, workers: list[multiprocessing.Process]):
+    stopping = asyncio.Event()
+        
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    
+    broker = Broker()
+    await broker.start(path=path)
+    
+    for worker in workers:
+        worker.start()
+        
+    print(f"\n🚌 Local broker is relaying {len(workers)} workers through {path}\n")
+    
+    async with broker.server:
+        await stopping.wait()
+        
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        
+        for worker in workers:
+            await loop.run_in_executor(None, worker.join)
+
+def main():
+    arguments = parse_arguments()
+    if arguments.workers < 2:
+        log_listener = start_logging(arguments=arguments)
+        try:
+            run_event_loop(serve(arguments=arguments, broker_address=arguments.broker), backend=arguments.loop)
+            
+        finally:
+            log_listener.stop()
+            
+        return
+    
+    if arguments.broker is not None:
+        context = multiprocessing.get_context("fork")
+        workers: list[multiprocessing.Process] = [
+            context.Process(target=run_worker, args=(arguments, arguments.broker), daemon=True)
+            for _ in range(arguments.workers)
+        ]
+        for worker in workers:
+            worker.start()
+            
+        for worker in workers:
+            worker.join()
+            
+        return
+    
+    broker_directory: str = tempfile.mkdtemp(prefix="chat-cli-")
+    broker_path: str = os.path.join(broker_directory, "broker.sock")
+    
+    context = multiprocessing.get_context("fork")
+    workers: list[multiprocessing.Process] = [
+        context.Process(target=run_worker, args=(arguments, broker_path), daemon=True)
+        for _ in range(arguments.workers)
+    ]
+    
+    log_listener = start_logging(arguments=arguments)
+    try:
+        run_event_loop(run_local_broker(path=broker_path, workers=workers), backend=arguments.loop)
+        
+    finally:
+        log_listener.stop()
+        
+        if os.path.exists(broker_path):
+            os.unlink(broker_path)
+            
+        os.rmdir(broker_directory)
 
 if __name__ == "__main__":
-    asyncio.run(main=main())
\ No newline at end of file
+    main()
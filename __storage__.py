@@ -0,0 +1,396 @@
+import os
+import mmap
+import zlib
+import struct
+import asyncio
+
+from collections import deque
+
+from __protocol__ import (
+    BUS_CREATE_ROOM,
+    BUS_SET_STATUS,
+    BUS_REMOVE_ROOM,
+    BUS_BROADCAST
+)
+
+RECORD_HEADER = struct.Struct("!IIIBH")
+INDEX_ENTRY = struct.Struct("!BIIH")
+INDEX_FOOTER = struct.Struct("!I")
+
+SEGMENT_SIZE: int = 64 << 20
+COMMIT_INTERVAL: float = 0.005
+INDEX_INTERVAL: int = 64
+
+def encode_record(kind: int, room_id: str, body: bytes = b"", ordinal: int = 0) -> bytes:
+    encoded_room_id = room_id.encode()
+    header_tail = RECORD_HEADER.pack(0, len(body), ordinal, kind, len(encoded_room_id))[4:]
+    checksum = zlib.crc32(body, zlib.crc32(encoded_room_id, zlib.crc32(header_tail)))
+    return struct.pack("!I", checksum) + header_tail + encoded_room_id + body
+
+def scan_records(buffer, start: int = 0):
+    offset = start
+    total = len(buffer)
+    while total - offset >= RECORD_HEADER.size:
+        checksum, length, ordinal, kind, room_id_length = RECORD_HEADER.unpack_from(buffer, offset)
+        room_id_start = offset + RECORD_HEADER.size
+        body_start = room_id_start + room_id_length
+        end = body_start + length
+        if end > total:
+            return
+
+        header_tail = buffer[offset + 4:room_id_start]
+        room_id = buffer[room_id_start:body_start]
+        body = buffer[body_start:end]
+        if zlib.crc32(body, zlib.crc32(room_id, zlib.crc32(header_tail))) != checksum:
+            return
+
+        yield offset, end, kind, ordinal, room_id.decode(), body
+        offset = end
+
+class Segment(object):
+    __slots__ = ("id", "path", "size", "rooms", "index", "file")
+
+    def __init__(self, directory: str, id: int) -> None:
+        self.id = id
+        self.path = os.path.join(directory, f"{id:08d}.log")
+        self.size = 0
+        self.rooms: set[str] = set()
+        self.index: list[tuple[int, int, int, str]] = []
+        self.file = None
+
+
+    @property
+    def index_path(self) -> str:
+        return self.path[:-len(".log")] + ".idx"
+
+
+    def write(self, data: bytes) -> None:
+        if self.file is None:
+            self.file = open(self.path, "ab")
+
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+
+    def seal(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        if self.size < 1:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+            return
+
+        encoded_index = bytearray()
+        for kind, offset, ordinal, room_id in self.index:
+            encoded_room_id = room_id.encode()
+            encoded_index += INDEX_ENTRY.pack(kind, offset, ordinal, len(encoded_room_id)) + encoded_room_id
+
+        encoded_index += INDEX_FOOTER.pack(zlib.crc32(encoded_index))
+
+        # Written aside and renamed, so a crash leaves the whole index or none and recovery rebuilds a missing one.
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "wb") as index_file:
+            index_file.write(encoded_index)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+        os.replace(temporary_path, self.index_path)
+
+
+    def load_index(self) -> bool:
+        with open(self.index_path, "rb") as index_file:
+            encoded_index = index_file.read()
+
+        # The index is all compaction knows of a segment's rooms, so one that does not check out is rebuilt instead.
+        entries = encoded_index[:-INDEX_FOOTER.size]
+        if len(encoded_index) < INDEX_FOOTER.size or INDEX_FOOTER.unpack_from(encoded_index, len(entries))[0] != zlib.crc32(entries):
+            return False
+
+        size = os.path.getsize(self.path)
+        index: list[tuple[int, int, int, str]] = []
+        offset = 0
+        try:
+            while offset < len(entries):
+                kind, record_offset, ordinal, room_id_length = INDEX_ENTRY.unpack_from(entries, offset)
+                offset += INDEX_ENTRY.size
+                room_id = entries[offset:offset + room_id_length].decode()
+                offset += room_id_length
+                if offset > len(entries) or record_offset >= size:
+                    return False
+
+                index.append((kind, record_offset, ordinal, room_id))
+
+        except (struct.error, UnicodeDecodeError):
+            return False
+
+        self.index = index
+        self.rooms = {room_id for _, _, _, room_id in index}
+        self.size = size
+        return True
+
+
+    def rebuild_index(self, index_interval: int) -> None:
+        valid_end = 0
+        with open(self.path, "r+b") as segment_file:
+            if os.fstat(segment_file.fileno()).st_size:
+                with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    for offset, end, kind, ordinal, room_id, _ in scan_records(mapped):
+                        if kind != BUS_BROADCAST or ordinal % index_interval == 0 or room_id not in self.rooms:
+                            self.index.append((kind, offset, ordinal, room_id))
+
+                        self.rooms.add(room_id)
+
+                        valid_end = end
+
+            segment_file.truncate(valid_end)
+
+        self.size = valid_end
+        self.seal()
+
+class RecoveredRoom(object):
+    __slots__ = ("title", "status", "start", "checkpoints", "messages", "ordinal")
+
+    def __init__(self, title: str, start: tuple[int, int], history_capacity: int) -> None:
+        self.title = title
+        self.status = "opened"
+        self.start = start
+        self.checkpoints: list[tuple[int, int, int]] = []
+        self.messages: deque[bytes] = deque(maxlen=max(history_capacity, 1))
+        self.ordinal = 0
+
+class MessageLog(object):
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = SEGMENT_SIZE,
+        commit_interval: float = COMMIT_INTERVAL,
+        index_interval: int = INDEX_INTERVAL
+    ) -> None:
+        self.directory = directory
+        self.segment_size = segment_size
+        self.commit_interval = commit_interval
+        self.index_interval = max(index_interval, 1)
+
+        self.segments: list[Segment] = []
+        self.active: Segment | None = None
+        self.ordinals: dict[str, int] = {}
+
+        self.pending: list[tuple[Segment, bytearray]] = []
+        self.sealing: list[Segment] = []
+        self.deleting: list[Segment] = []
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task = None
+
+
+    def recover(self, history_capacity: int) -> dict[str, RecoveredRoom]:
+        os.makedirs(self.directory, exist_ok=True)
+
+        names: list[str] = os.listdir(self.directory)
+        for name in names:
+            if name.endswith(".idx.tmp"):
+                os.unlink(os.path.join(self.directory, name))
+
+        segment_ids = sorted(int(name[:-len(".log")]) for name in names if name.endswith(".log"))
+        self.segments = [Segment(directory=self.directory, id=segment_id) for segment_id in segment_ids]
+
+        for segment in self.segments:
+            if not os.path.exists(segment.index_path) or not segment.load_index():
+                segment.rebuild_index(index_interval=self.index_interval)
+
+        self.segments = [segment for segment in self.segments if segment.size > 0]
+
+        mapped_segments: list[mmap.mmap] = []
+        for segment in self.segments:
+            with open(segment.path, "rb") as segment_file:
+                mapped_segments.append(mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+        try:
+            rooms = self.__replay_index(mapped_segments=mapped_segments, history_capacity=history_capacity)
+            self.__replay_messages(rooms=rooms, mapped_segments=mapped_segments, history_capacity=history_capacity)
+
+        finally:
+            for mapped in mapped_segments:
+                mapped.close()
+
+        for room_id, room in rooms.items():
+            self.ordinals[room_id] = room.ordinal
+
+        self.compact(live_room_ids=rooms.keys())
+        self.__delete_segments(self.deleting)
+        self.deleting.clear()
+
+        next_id = self.segments[-1].id + 1 if self.segments else 1
+        self.active = Segment(directory=self.directory, id=next_id)
+        self.segments.append(self.active)
+
+        return rooms
+
+
+    def __replay_index(self, mapped_segments: list, history_capacity: int) -> dict[str, RecoveredRoom]:
+        rooms: dict[str, RecoveredRoom] = {}
+        for position, segment in enumerate(self.segments):
+            mapped = mapped_segments[position]
+            for kind, offset, ordinal, room_id in segment.index:
+                if kind == BUS_CREATE_ROOM:
+                    body = next(scan_records(mapped, offset))[-1]
+                    rooms[room_id] = RecoveredRoom(
+                        title=body.decode(),
+                        start=(position, offset),
+                        history_capacity=history_capacity
+                    )
+
+                elif kind == BUS_SET_STATUS and room_id in rooms:
+                    body = next(scan_records(mapped, offset))[-1]
+                    rooms[room_id].status = body.decode()
+
+                elif kind == BUS_REMOVE_ROOM:
+                    rooms.pop(room_id, None)
+
+                elif kind == BUS_BROADCAST and room_id in rooms:
+                    rooms[room_id].checkpoints.append((position, offset, ordinal))
+
+        for room in rooms.values():
+            if not room.checkpoints:
+                continue
+
+            last_ordinal = room.checkpoints[-1][2]
+            for position, offset, ordinal in reversed(room.checkpoints):
+                if ordinal <= last_ordinal - history_capacity:
+                    room.start = (position, offset)
+                    break
+
+        return rooms
+
+
+    def __replay_messages(self, rooms: dict[str, RecoveredRoom], mapped_segments: list, history_capacity: int) -> None:
+        if not rooms:
+            return
+
+        first_position, first_offset = min(room.start for room in rooms.values())
+        for position in range(first_position, len(self.segments)):
+            start = first_offset if position == first_position else 0
+            for offset, _, kind, ordinal, room_id, body in scan_records(mapped_segments[position], start):
+                if kind != BUS_BROADCAST:
+                    continue
+
+                room = rooms.get(room_id)
+                if room is None or (position, offset) < room.start:
+                    continue
+
+                room.messages.append(body)
+                room.ordinal = ordinal + 1
+
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.__commit_forever())
+
+
+    def append(self, kind: int, room_id: str, body: bytes = b"") -> None:
+        if self.closed:
+            return
+
+        ordinal = 0
+        if kind == BUS_BROADCAST:
+            ordinal = self.ordinals.get(room_id, 0)
+            self.ordinals[room_id] = ordinal + 1
+
+        elif kind == BUS_REMOVE_ROOM:
+            self.ordinals.pop(room_id, None)
+
+        record = encode_record(kind=kind, room_id=room_id, body=body, ordinal=ordinal)
+
+        active = self.active
+        if active.size and active.size + len(record) > self.segment_size:
+            self.sealing.append(active)
+            active = self.active = Segment(directory=self.directory, id=active.id + 1)
+            self.segments.append(active)
+
+        # Every room gets at least one entry per segment, the index is all a reloaded segment knows of its rooms.
+        if kind != BUS_BROADCAST or ordinal % self.index_interval == 0 or room_id not in active.rooms:
+            active.index.append((kind, active.size, ordinal, room_id))
+
+        active.rooms.add(room_id)
+        active.size += len(record)
+
+        if not self.pending or self.pending[-1][0] is not active:
+            self.pending.append((active, bytearray()))
+
+        self.pending[-1][1].extend(record)
+        self.ready.set()
+
+
+    def compact(self, live_room_ids) -> None:
+        # A segment of dead rooms may hold the tombstones of a room created in an older segment that is kept,
+        # so it is only deleted once no surviving older segment mentions any of its rooms.
+        kept_room_ids: set[str] = set()
+        for segment in list(self.segments):
+            deletable = segment is not self.active and segment not in self.sealing
+            if deletable and segment.rooms.isdisjoint(live_room_ids) and segment.rooms.isdisjoint(kept_room_ids):
+                self.segments.remove(segment)
+                self.deleting.append(segment)
+                continue
+
+            kept_room_ids |= segment.rooms
+
+        if self.deleting:
+            self.ready.set()
+
+
+    @staticmethod
+    def __delete_segments(segments: list[Segment]) -> None:
+        for segment in segments:
+            for path in (segment.path, segment.index_path):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+
+    @classmethod
+    def __commit(cls, batch: list[tuple[Segment, bytearray]], sealing: list[Segment], deleting: list[Segment]) -> None:
+        for segment, data in batch:
+            segment.write(data)
+
+        for segment in sealing:
+            segment.seal()
+
+        cls.__delete_segments(deleting)
+
+
+    async def __commit_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self.pending or self.sealing or self.deleting or not self.closed:
+            await self.ready.wait()
+            if not self.closed:
+                await asyncio.sleep(self.commit_interval)
+
+            self.ready.clear()
+
+            batch, self.pending = self.pending, []
+            sealing, self.sealing = self.sealing, []
+            deleting, self.deleting = self.deleting, []
+            await loop.run_in_executor(None, self.__commit, batch, sealing, deleting)
+
+
+    def reopen(self) -> None:
+        # The segment close() sealed stays as it is, writes carry on in a fresh one.
+        if not self.closed:
+            return
+
+        self.closed = False
+        self.active = Segment(directory=self.directory, id=self.active.id + 1)
+        self.segments.append(self.active)
+        self.start()
+
+
+    async def close(self) -> None:
+        if self.closed or self.task is None:
+            return
+
+        self.closed = True
+        self.sealing.append(self.active)
+        self.ready.set()
+        await self.task
@@ -0,0 +1,66 @@
+import os
+import asyncio
+
+from __protocol__ import BUS_CREATE_ROOM, BUS_SET_STATUS, BUS_REMOVE_ROOM, BUS_BROADCAST
+from __storage__ import MessageLog
+
+def write_log(directory: str, records: list[tuple[int, str, bytes]], live_room_ids: set[str], segment_size: int = 80) -> None:
+    async def scenario() -> None:
+        log = MessageLog(directory=directory, segment_size=segment_size, commit_interval=0)
+        log.recover(history_capacity=16)
+        log.start()
+        for kind, room_id, body in records:
+            log.append(kind, room_id, body)
+            if kind == BUS_REMOVE_ROOM:
+                log.compact(live_room_ids=live_room_ids)
+
+        await asyncio.sleep(0.05)
+        log.compact(live_room_ids=live_room_ids)
+        await log.close()
+
+    asyncio.run(scenario())
+
+def test_compaction_keeps_the_tombstones_of_rooms_created_in_a_kept_segment(tmp_path):
+    # The first segment holds both creations, the second only the tombstones of X, the rest messages of Y.
+    records = [
+        (BUS_CREATE_ROOM, "X", b"x" * 20),
+        (BUS_CREATE_ROOM, "Y", b"y" * 20),
+        (BUS_SET_STATUS, "X", b"removing"),
+        (BUS_REMOVE_ROOM, "X", b""),
+    ]
+    messages = [b"%02d" % index + b"m" * 48 for index in range(4)]
+    records += [(BUS_BROADCAST, "Y", message) for message in messages]
+    write_log(directory=str(tmp_path), records=records, live_room_ids={"Y"})
+
+    for _ in range(2):
+        rooms = MessageLog(directory=str(tmp_path)).recover(history_capacity=16)
+        assert set(rooms) == {"Y"}
+        assert list(rooms["Y"].messages) == messages
+
+def test_compaction_deletes_segments_that_only_hold_removed_rooms(tmp_path):
+    records = [(BUS_CREATE_ROOM, "X", b"x")]
+    records += [(BUS_BROADCAST, "X", b"message %d" % index) for index in range(8)]
+    records += [(BUS_REMOVE_ROOM, "X", b""), (BUS_CREATE_ROOM, "Y", b"y")]
+    write_log(directory=str(tmp_path), records=records, live_room_ids={"Y"})
+
+    rooms = MessageLog(directory=str(tmp_path)).recover(history_capacity=16)
+    assert set(rooms) == {"Y"}
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".log")]) <= 3
+
+def test_recovery_rebuilds_a_damaged_index(tmp_path):
+    records = [(BUS_CREATE_ROOM, "X", b"x" * 20), (BUS_CREATE_ROOM, "Y", b"y" * 20)]
+    messages = [b"%02d" % index + b"m" * 48 for index in range(4)]
+    records += [(BUS_BROADCAST, "X", message) for message in messages]
+    write_log(directory=str(tmp_path), records=records, live_room_ids={"X", "Y"})
+
+    index_paths = sorted(str(path) for path in tmp_path.glob("*.idx"))
+    with open(index_paths[0], "r+b") as index_file:
+        index_file.truncate(os.path.getsize(index_paths[0]) // 2)
+
+    with open(index_paths[1], "wb"):
+        pass
+
+    for _ in range(2):
+        rooms = MessageLog(directory=str(tmp_path)).recover(history_capacity=16)
+        assert set(rooms) == {"X", "Y"}
+        assert list(rooms["X"].messages) == messages